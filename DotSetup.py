@@ -14,26 +14,41 @@
 #  License:   Copyright (c) 2026, John Warnes
 # ===========================================================================
 
-# Required Python3 and Pip3
+# Required Python3 (standard library only)
 
-import argparse
-import configparser
-import datetime
+# Only modules every command needs are imported here. Heavier ones
+# (subprocess, shutil, datetime, json, configparser, argparse, ...) are
+# imported inside the functions that use them to keep cold start fast.
+# `--bench-startup` checks the whole cold start against SETTINGS["startup_budget_ms"].
 import os
-import platform
 import re
-import shutil
-import subprocess
 import sys
-from dataclasses import dataclass, field
+from contextlib import ExitStack, contextmanager
+from functools import cached_property, lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
-from packaging.version import parse as parse_version
+if TYPE_CHECKING:
+    import argparse
+    import tarfile
+    from concurrent.futures import Executor
 
 
-@dataclass
-class UserData:
+class UserData(NamedTuple):
     name: str
     user: str
     company: str
@@ -41,43 +56,184 @@ class UserData:
     vim: str
 
 
-@dataclass
+class ManagedEntry(NamedTuple):
+    """
+    One path managed by DotSetup, from the managed-entry manifest (see managed_entries()).
+    """
+
+    id: str  # Snapshot key, unique per host
+    source: Optional[Path]  # In the dotfiles tree, for "link" entries
+    dest: Path
+    kind: str  # "link": dest is a symlink to source, "file": dest is managed in place
+    backup: bool  # Included in backups and restores
+
+
 class SystemData:
-    home: Path
-    nvim_config: Path
-    script_dir: Path
-    script_file: str
-    os_kind: str
-    os_release: str
-    arch: str
-    os_name: str
-    os_version: str
-    os_codename: Optional[str]
-    shell: Optional[str]
-    version: Dict[str, Optional[str]] = field(
-        default_factory=lambda: {"shell": None, "vim": None, "nvim": None, "tmux": None, "ssh": None, "gpg": None}
-    )
+    """
+    Host system information.
 
+    Every field is resolved on first access and memoized, so OS detection,
+    the parent shell lookup and the version probes only run for commands
+    that actually use them.
+    """
 
-SYSTEM: SystemData = SystemData(
-    home=Path.home(),
-    nvim_config=Path(os.environ.get("XDG_CONFIG_HOME", str(Path.home() / ".config"))),
-    script_dir=Path(os.path.realpath(sys.argv[0])).parent,
-    script_file=Path(__file__).name,
-    os_kind=platform.system(),
-    os_release=platform.release(),
-    arch=platform.machine(),
-    os_name="",
-    os_version="",
-    os_codename=None,
-    shell=None,
-)
+    def __init__(self, refresh: bool = False) -> None:
+        # Re-probe tool versions instead of using cached results
+        self.refresh = refresh
+
+    @cached_property
+    def home(self) -> Path:
+        return Path.home()
+
+    @cached_property
+    def nvim_config(self) -> Path:
+        return Path(os.environ.get("XDG_CONFIG_HOME", str(self.home / ".config")))
+
+    @cached_property
+    def script_dir(self) -> Path:
+        return get_script_path()
+
+    @cached_property
+    def script_file(self) -> str:
+        return Path(__file__).name
+
+    @cached_property
+    def os_kind(self) -> str:
+        import platform
+        return platform.system()  # Linux, Darwin, Windows
+
+    @cached_property
+    def os_release(self) -> str:
+        import platform
+        return platform.release()
+
+    @cached_property
+    def arch(self) -> str:
+        import platform
+        return platform.machine()  # x86_64, i686, armv7l, aarch64, etc.
+
+    @cached_property
+    def os_details(self) -> Tuple[str, str, Optional[str]]:
+        """
+        Detect the OS name, version and codename (Linux/macOS/Windows).
+        """
+        import platform
+
+        os_kind = self.os_kind
+
+        # Get OS-specific information
+        if os_kind == "Linux":
+            try:
+                # Read /etc/os-release file (standard on most modern Linux distros)
+                with open("/etc/os-release") as f:
+                    os_release_data = {}
+                    for line in f:
+                        if "=" in line:
+                            key, value = line.strip().split("=", 1)
+                            # Remove quotes from value
+                            os_release_data[key] = value.strip('"')
+
+                    os_name = os_release_data.get("NAME", "Linux")
+                    os_version = os_release_data.get("VERSION_ID", platform.release())
+                    os_codename = os_release_data.get("VERSION_CODENAME", os_release_data.get("CODENAME", None))
+            except (FileNotFoundError, PermissionError):
+                os_name = "Linux"
+                os_version = platform.release()
+                os_codename = None
+
+        elif os_kind == "Darwin":
+            # macOS
+            mac_ver = platform.mac_ver()[0]  # e.g., '12.6.0' or '13.0.1'
+            os_version = mac_ver
+            os_name = "macOS"
+            os_codename = None
+
+        elif os_kind == "Windows":
+            # Windows
+            win_ver = platform.win32_ver()
+            release, version, csd, _ = win_ver
+            os_version = version  # e.g., '10.0.19041'
+
+            # Distinguish Windows 11 from Windows 10 by build number
+            try:
+                version_parts = version.split(".")
+                major = int(version_parts[0])
+                build = int(version_parts[2]) if len(version_parts) > 2 else 0
+
+                if major == 10 and build >= 22000:
+                    os_name = "Windows 11"
+                else:
+                    os_name = f"Windows {release}" if release else "Windows"
+            except (ValueError, IndexError):
+                os_name = f"Windows {release}" if release else "Windows"
+            os_codename = csd if csd else None  # Service pack info
+
+        else:
+            # Unknown/Other OS
+            os_name = os_kind
+            os_version = platform.release()
+            os_codename = None
+
+        return os_name, os_version, os_codename
+
+    @property
+    def os_name(self) -> str:
+        return self.os_details[0]
+
+    @property
+    def os_version(self) -> str:
+        return self.os_details[1]
+
+    @property
+    def os_codename(self) -> Optional[str]:
+        return self.os_details[2]
+
+    @cached_property
+    def shell(self) -> Optional[str]:
+        """
+        Name of the current shell, from $SHELL or the parent process.
+        """
+        import subprocess
+
+        shell_path = os.environ.get("SHELL", "")
+        if shell_path:
+            return shell_path.split("/")[-1]
+        try:
+            # Get parent process (the shell that launched this script)
+            ppid = os.getppid()
+            return run_probe(["ps", "-p", str(ppid), "-o", "comm="]) or None
+        except (subprocess.TimeoutExpired, OSError):
+            return None
+
+    @cached_property
+    def version(self) -> Dict[str, Optional[str]]:
+        """
+        Installed tool versions, all probes run concurrently.
+        """
+        return probe_versions(self.shell, refresh=self.refresh)
+
+
+SYSTEM: SystemData = SystemData()
 
 
 SETTINGS: Dict[str, Any] = {
     # DotSetup Script Version
     "version": "4.0.4",
     # Directories
+    # Managed-entry manifest in the dotfiles tree: every path DotSetup
+    # links, backs up and restores (see managed_entries())
+    "managed": "managed.json",
+    # Vim config whose minpac#add() calls list the plugins DotSetup installs
+    "plugin_config": "vim/vim8/vim8.vim",
+    # Clone URL of an "owner/name" plugin
+    "plugin_url": "https://github.com/{repo}.git",
+    # Lockfile in the dotfiles tree pinning the commit of every plugin
+    # (written by --plugins-update, checked out by install and --plugins-sync)
+    "plugin_lock": "vim/plugins.lock.json",
+    # Bare mirrors of the plugin repositories (--plugins-mirror) that plugin
+    # clones borrow their objects from; None uses the machine-wide
+    # /var/cache/dotsetup/mirrors if it exists, else $XDG_CACHE_HOME/dotsetup/mirrors.
+    "plugin_mirrors": None,
     "dotfiles": "~/dotfiles",
     # Note: backup_path will be set dynamically in collect_system_data() to use script_dir
     "backup_path": None,
@@ -90,8 +246,114 @@ SETTINGS: Dict[str, Any] = {
         "gpg": "2.4.4",
         "shell": "5.2.1",  # 5.2.21(1)-release
     },
+    # Maximum cold start of `python3 DotSetup.py --help` (interpreter, compile,
+    # imports and script body, in milliseconds), checked by --bench-startup
+    "startup_budget_ms": 150.0,
+    # Backup storage: "store" deduplicates file contents in a shared
+    # content-addressed object store, "link" keeps a browsable tree per
+    # snapshot with unchanged files hardlinked to the previous snapshot,
+    # "copy" keeps a full copy per snapshot, "archive" streams each snapshot
+    # into one compressed tar (zstd or xz, multi-threaded)
+    "backup_mode": "store",
+    # Full snapshots kept by --backup-prune: the newest "last", plus the newest
+    # snapshot of each of the last "daily" days and "weekly" ISO weeks that
+    # have one (0 disables a rule). The newest full snapshot is always kept;
+    # partial (install/restore safety) snapshots go once a newer kept full
+    # snapshot covers them
+    "backup_retention": {"last": 5, "daily": 7, "weekly": 8},
+    # Run the retention policy after every backup
+    "backup_prune_after_backup": False,
+    # Worker threads copying files during backup and restore, and cloning
+    # plugins (both are I/O bound, so this can exceed the CPU count); 1 runs serially
+    "jobs": 8,
+    # Interactive shells started per shell by --profile-shell
+    "profile_runs": 10,
+    # Seconds before a hung version probe is abandoned
+    "probe_timeout": 5.0,
+    # Tool version probes: the command is executed directly (no shell), the
+    # first line of `stream` is matched against `regex` and group 1 is the
+    # version. "{shell}" in argv is replaced by the current shell name.
+    # Add a tool by adding an entry; add it to "recommended" to get a ✓/✗ check.
+    "probes": {
+        "shell": {
+            "label": "shell",
+            "argv": ["{shell}", "--version"],
+            "stream": "stdout",
+            "regex": r"(?:bash, version|zsh) (\S+)",
+        },
+        "vim": {"label": "Vim", "argv": ["vim", "--version"], "stream": "stdout", "regex": r"IMproved (\S+)"},
+        "nvim": {"label": "NeoVim", "argv": ["nvim", "--version"], "stream": "stdout", "regex": r"NVIM v(\S+)"},
+        "tmux": {"label": "Tmux", "argv": ["tmux", "-V"], "stream": "stdout", "regex": r"tmux (?:next-)?(\S+)"},
+        "ssh": {"label": "SSH", "argv": ["ssh", "-V"], "stream": "stderr", "regex": r"OpenSSH_([^\s,]+)"},
+        "gpg": {"label": "GPG", "argv": ["gpg", "--version"], "stream": "stdout", "regex": r"\(GnuPG\) (\S+)"},
+        "git": {"label": "Git", "argv": ["git", "--version"], "stream": "stdout", "regex": r"git version (\S+)"},
+        "python": {"label": "Python", "argv": ["python3", "--version"], "stream": "stdout", "regex": r"Python (\S+)"},
+        "node": {"label": "Node", "argv": ["node", "--version"], "stream": "stdout", "regex": r"v(\S+)"},
+        "rg": {"label": "ripgrep", "argv": ["rg", "--version"], "stream": "stdout", "regex": r"ripgrep (\S+)"},
+    },
 }
 
+# Version reported for a tool whose probe exceeded SETTINGS["probe_timeout"]
+PROBE_TIMED_OUT = "timed out"
+
+# Per-snapshot manifest file and the shared content-addressed object store,
+# both relative to SETTINGS["backup_path"]
+BACKUP_MANIFEST = "manifest.json"
+BACKUP_OBJECTS = "objects"
+# Append-only index of all snapshots, one JSON record per line, and the
+# compact current state it replays to (summaries without per-file digests)
+BACKUP_CATALOG = "catalog.jsonl"
+BACKUP_CATALOG_STATE = "catalog-state.json"
+
+# Archive backups: (file suffix, compress command, decompress command), in
+# order of preference. The commands must be multi-threaded stream filters.
+# If none is installed, Python's lzma module writes a .tar.xz itself.
+BACKUP_ARCHIVERS = [
+    (".tar.zst", ["zstd", "-T0", "-q", "-c"], ["zstd", "-d", "-q", "-c"]),
+    (".tar.xz", ["xz", "-T0", "-c"], ["xz", "-d", "-c"]),
+]
+
+# Machine-wide plugin mirror cache shared by every account; used whenever it
+# exists and is readable (an admin creates it, e.g. group-writable and setgid)
+SHARED_PLUGIN_MIRRORS = Path("/var/cache/dotsetup/mirrors")
+# Plugin clones borrow objects from the mirrors (git alternates), so a mirror
+# must never lose one: no automatic gc, no pruning, fetched without --prune
+PLUGIN_MIRROR_CONFIG = {"gc.auto": "0", "gc.pruneExpire": "never", "maintenance.auto": "false"}
+
+# Offline bundles (--bundle-create): last archive member, listing the SHA-256
+# of every file, and the parts of the dotfiles tree that are never bundled
+# (per-user files, backups; plugins are bundled from self-contained copies).
+# In a git checkout only tracked files are bundled in the first place.
+BUNDLE_MANIFEST = "dotfiles-bundle.json"
+BUNDLE_EXCLUDE = (
+    ".git",
+    "backup",
+    "vim/pack",
+    "vim/undo",
+    "vim/view",
+    "vim/user.vim",
+    "git/gitconfig",
+    "__pycache__",
+)
+
+# Shell init snapshot (--shell-init): git-prompt scripts autorun.sh looks for,
+# in order, and scripts/detectOS.sh's OS names by sys.platform prefix
+SHELL_GIT_PROMPTS = (
+    "/usr/lib/git-core/git-sh-prompt",
+    "/usr/share/git-core/contrib/completion/git-prompt.sh",
+)
+SHELL_OS_KINDS = (
+    ("linux", "LINUX"),
+    ("darwin", "OSX"),
+    ("sunos", "SOLARIS"),
+    ("freebsd", "BSD"),
+    ("openbsd", "BSD"),
+    ("netbsd", "BSD"),
+    ("cygwin", "BABUN"),
+    ("msys", "WINDOWS"),
+    ("win32", "WINDOWS"),
+)
+
 
 class Colors:
     # Regular colors
@@ -211,6 +473,8 @@ def safe_symlink(src: Union[str, Path], dest: Union[str, Path]) -> None:
         src: Source path for the symlink
         dest: Destination path where symlink will be created
     """
+    import shutil
+
     dest_path = Path(dest).expanduser()
     src_path = Path(src).expanduser()
 
@@ -227,189 +491,762 @@ def safe_symlink(src: Union[str, Path], dest: Union[str, Path]) -> None:
     dest_path.symlink_to(src_path)
 
 
-def backup_file(file_path: Union[str, Path], backup_dir: Path) -> bool:
+def file_digest(path: Union[str, Path]) -> str:
+    """
+    Return the SHA-256 hex digest of a file's contents.
+    """
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def open_new_file(path: Path, mode: int = 0o600) -> BinaryIO:
+    """
+    Create a file for writing with the given permissions (0600 by default),
+    regardless of the umask, so backups of private files stay private.
+    A leftover file of the same name is replaced, never written through.
+    """
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    return os.fdopen(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, mode), "wb")
+
+
+def blob_path(backup_base: Path, digest: str) -> Path:
+    """
+    Location of a content-addressed blob: {backup_base}/objects/ab/cdef...
+    """
+    return backup_base / BACKUP_OBJECTS / digest[:2] / digest[2:]
+
+
+def store_blob(backup_base: Path, source: Path) -> Tuple[str, bool]:
+    """
+    Copy a file into the content-addressed object store.
+
+    The file is hashed while it is copied, so the blob name always matches
+    the bytes stored even if the source changes underneath us. Identical
+    content is stored once.
+
+    Returns:
+        (digest, True if new bytes were written)
+    """
+    import hashlib
+    import threading
+
+    objects = backup_base / BACKUP_OBJECTS
+    objects.mkdir(mode=0o700, parents=True, exist_ok=True)
+    tmp_path = objects / f"tmp.{os.getpid()}.{threading.get_ident()}"
+    digest = hashlib.sha256()
+    try:
+        with open(source, "rb") as src, open_new_file(tmp_path) as dst:
+            for chunk in iter(lambda: src.read(1 << 20), b""):
+                digest.update(chunk)
+                dst.write(chunk)
+        blob = blob_path(backup_base, digest.hexdigest())
+        try:
+            # Reused: a fresh mtime keeps it out of a concurrent prune's reach
+            os.utime(blob)
+            tmp_path.unlink()
+            return digest.hexdigest(), False
+        except FileNotFoundError:
+            pass
+        blob.parent.mkdir(mode=0o700, exist_ok=True)
+        os.replace(tmp_path, blob)
+        return digest.hexdigest(), True
+    except BaseException:
+        try:
+            tmp_path.unlink()
+        except OSError:
+            pass
+        raise
+
+
+def walk_target(source: Path, name: str) -> Iterator[Tuple[str, Path, os.stat_result]]:
+    """
+    Walk a backup target, yielding (snapshot key, path, lstat) for it and
+    everything below it. Keys are POSIX paths relative to the snapshot root,
+    starting with `name`. Symlinks, including the target itself, are
+    yielded, not followed.
+    """
+    yield name, source, source.lstat()
+    if source.is_symlink() or not source.is_dir():
+        return
+    for root, dirs, files in os.walk(source):
+        rel_root = Path(root).relative_to(source)
+        for entry in sorted(dirs) + sorted(files):
+            path = Path(root) / entry
+            yield (Path(name) / rel_root / entry).as_posix(), path, path.lstat()
+        dirs.sort()
+
+
+def stored_stat(path: Path) -> List[int]:
+    """
+    Stat tuple of stored backup data (size, mtime, inode), recorded at backup
+    time so verify_backups() can skip re-hashing data that was not touched.
+    """
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns, st.st_ino]
+
+
+def mmap_digest(path: Path) -> str:
+    """
+    SHA-256 of a file, hashed straight from a read-only memory map.
+    hashlib releases the GIL while hashing, so threads hash in parallel.
+    """
+    import hashlib
+    import mmap
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return hashlib.sha256().hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            return hashlib.sha256(m).hexdigest()
+
+
+def entry_path(root: Path, name: str, key: str) -> Path:
+    """
+    Location of snapshot key `key` below a target whose top-level key is `name`.
+    """
+    return root / Path(key).relative_to(name) if key != name else root
+
+
+def below_symlink(root: Path, path: Path) -> bool:
+    """
+    Whether `path` is reached through a symlink: `root` or a directory
+    between it and `path` is one. Such a path belongs to the link target,
+    not to the tree below `root`.
+    """
+    if path == root:
+        return False
+    if root.is_symlink():
+        return True
+    current = root
+    for part in path.relative_to(root).parts[:-1]:
+        current = current / part
+        if current.is_symlink():
+            return True
+    return False
+
+
+def snapshot_file_path(backup_dir: Path, manifest: Dict[str, Any], key: str) -> Path:
+    """
+    Location of the stored contents of a file record in a snapshot.
+    """
+    if manifest["layout"] == "objects":
+        return blob_path(backup_dir.parent, manifest["files"][key]["digest"])
+    return backup_dir / key
+
+
+class ArchiveAborted(Exception):
+    """
+    An archive member was only partly written. Everything streamed after it
+    is unreadable, so the whole archive snapshot has to be abandoned.
+    """
+
+
+class HashingReader:
+    """
+    Read-only file wrapper that computes the SHA-256 of everything read through it.
+    """
+
+    def __init__(self, f: BinaryIO) -> None:
+        import hashlib
+
+        self.f = f
+        self.digest = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.digest.update(data)
+        return data
+
+
+def archive_suffix() -> str:
+    """
+    Archive file suffix for new snapshots, based on the installed compressors.
+    """
+    import shutil
+
+    for suffix, compress, _ in BACKUP_ARCHIVERS:
+        if shutil.which(compress[0]):
+            return suffix
+    return ".tar.xz"
+
+
+@contextmanager
+def archive_writer(archive: Path, mode: int = 0o600) -> Iterator["tarfile.TarFile"]:
+    """
+    Open a streaming tar writer that pipes straight into a multi-threaded
+    compressor (see BACKUP_ARCHIVERS). Nothing is staged on disk. The
+    archive is created with the given permissions (see open_new_file()).
+    """
+    import shutil
+    import subprocess
+    import tarfile
+
+    command = next((c for suffix, c, _ in BACKUP_ARCHIVERS if archive.name.endswith(suffix)), None)
+    with open_new_file(archive, mode) as out:
+        if command is None or not shutil.which(command[0]):
+            # Single-threaded fallback, only possible for .tar.xz
+            with tarfile.open(fileobj=out, mode="w|xz") as tar:
+                yield tar
+            return
+
+        proc = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=out)
+        assert proc.stdin is not None
+        try:
+            with tarfile.open(fileobj=proc.stdin, mode="w|") as tar:
+                yield tar
+        finally:
+            proc.stdin.close()
+            if proc.wait() != 0:
+                raise OSError(f"{command[0]} failed with exit code {proc.returncode}")
+
+
+@contextmanager
+def archive_reader(archive: Path) -> Iterator["tarfile.TarFile"]:
+    """
+    Open a streaming tar reader over a compressed snapshot archive.
+    Members can only be visited once, in archive order.
+    """
+    import shutil
+    import subprocess
+    import tarfile
+
+    command = next((c for suffix, _, c in BACKUP_ARCHIVERS if archive.name.endswith(suffix)), None)
+    if command is None or not shutil.which(command[0]):
+        if not archive.name.endswith(".tar.xz"):
+            raise OSError(f"no decompressor installed for {archive.name}")
+        with tarfile.open(archive, mode="r|xz") as tar:
+            yield tar
+        return
+
+    with open(archive, "rb") as f:
+        proc = subprocess.Popen(command, stdin=f, stdout=subprocess.PIPE)
+        assert proc.stdout is not None
+        try:
+            with tarfile.open(fileobj=proc.stdout, mode="r|") as tar:
+                yield tar
+        finally:
+            # Stop decompressing once the members we need are read
+            proc.stdout.close()
+            proc.kill()
+            proc.wait()
+
+
+def read_snapshot_files(
+    backup_dir: Path, manifest: Dict[str, Any], keys: Iterable[str]
+) -> Iterator[Tuple[str, BinaryIO]]:
+    """
+    Yield (key, readable file) for the stored contents of the given file keys.
+
+    For archive snapshots the archive is streamed once and only the wanted
+    members are read; the rest are skipped without being written anywhere.
+    Keys are yielded in storage order, not the order given.
+    """
+    wanted = set(keys)
+    if manifest["layout"] == "archive":
+        with archive_reader(backup_dir / manifest["archive"]) as tar:
+            for member in tar:
+                if member.name in wanted and member.isfile():
+                    reader = tar.extractfile(member)
+                    if reader is not None:
+                        yield member.name, reader
+                    wanted.discard(member.name)
+                    if not wanted:
+                        break
+        return
+
+    for key in sorted(wanted):
+        with open(snapshot_file_path(backup_dir, manifest, key), "rb") as f:
+            yield key, f
+
+
+def store_file(
+    path: Path,
+    st: os.stat_result,
+    key: str,
+    backup_dir: Path,
+    previous: Optional[Dict[str, Any]] = None,
+    archive: Optional["tarfile.TarFile"] = None,
+) -> Tuple[Dict[str, Any], int]:
+    """
+    Store one regular file in a snapshot according to SETTINGS["backup_mode"].
+
+    - "store": contents go to the shared object store (see store_blob()). A
+      file whose size and mtime match the previous snapshot reuses its blob
+      without being read.
+    - "link": the snapshot is a complete tree, but a file whose size, mtime
+      and digest match the previous snapshot is hardlinked to the previous
+      copy instead of copied (like rsync --link-dest).
+    - "copy": the file is copied into the snapshot tree.
+    - "archive": the file is streamed into the snapshot's compressed tar.
+
+    Args:
+        path: File to store
+        st: lstat() of the file
+        key: Snapshot key of the file
+        backup_dir: Snapshot directory
+        previous: Manifest of the previous snapshot
+        archive: Open archive_writer() for "archive" mode
+
+    Returns:
+        (manifest record, number of new bytes written)
+    """
+    import shutil
+    import stat
+    import tarfile
+
+    backup_base = backup_dir.parent
+    backup_mode = SETTINGS["backup_mode"]
+    record: Dict[str, Any] = {
+        "type": "file",
+        "size": st.st_size,
+        "mtime": st.st_mtime_ns,
+        "mode": stat.S_IMODE(st.st_mode),
+    }
+
+    old = previous["files"].get(key) if previous else None
+    unchanged = bool(
+        old
+        and old.get("type") == "file"
+        and old.get("digest")
+        and old.get("size") == st.st_size
+        and old.get("mtime") == st.st_mtime_ns
+    )
+
+    if archive is not None:
+        info = tarfile.TarInfo(key)
+        info.size = st.st_size
+        info.mtime = int(st.st_mtime)
+        info.mode = record["mode"]
+        with open(path, "rb") as f:
+            reader = HashingReader(f)
+            try:
+                archive.addfile(info, reader)
+            except Exception as e:
+                # The header promised st_size bytes; a file that shrank or a
+                # failed read leaves a torn member in the stream
+                raise ArchiveAborted(f"{path}: {e}") from e
+        record["digest"] = reader.digest.hexdigest()
+        return record, st.st_size
+
+    if backup_mode == "store":
+        if unchanged:
+            blob = blob_path(backup_base, old["digest"])
+            try:
+                # Reused: a fresh mtime keeps it out of a concurrent prune's
+                # reach (see collect_garbage())
+                os.utime(blob)
+                record["digest"] = old["digest"]
+                record["stored"] = stored_stat(blob)
+                return record, 0
+            except FileNotFoundError:
+                pass  # Collected meanwhile, store it again
+        record["digest"], written = store_blob(backup_base, path)
+        record["stored"] = stored_stat(blob_path(backup_base, record["digest"]))
+        return record, st.st_size if written else 0
+
+    dest = backup_dir / key
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    old_path = snapshot_file_path(backup_base / previous["timestamp"], previous, key) if unchanged else None
+    if backup_mode == "link" and old_path is not None and old_path.exists():
+        digest = file_digest(path)
+        if digest == old["digest"]:
+            try:
+                os.link(old_path, dest)
+                record["digest"] = digest
+                record["stored"] = stored_stat(dest)
+                return record, 0
+            except OSError:
+                pass  # Different filesystem or link limit reached, copy instead
+    shutil.copy2(path, dest)
+    record["digest"] = file_digest(dest)
+    record["stored"] = stored_stat(dest)
+    return record, st.st_size
+
+
+def backup_file(
+    file_path: Union[str, Path],
+    backup_dir: Path,
+    manifest: Dict[str, Any],
+    previous: Optional[Dict[str, Any]] = None,
+    archive: Optional["tarfile.TarFile"] = None,
+    keys: Optional[Iterable[str]] = None,
+    pool: Optional["Executor"] = None,
+    name: Optional[str] = None,
+) -> bool:
     """
     Backup a file or directory to the backup session directory before modifying it.
+
+    Every file, directory and symlink is recorded in the snapshot manifest;
+    file contents are stored according to SETTINGS["backup_mode"] (see
+    store_file()).
+
+    Symlinks are recorded as links with their target and never followed, so
+    ~/.vim -> {dotfiles}/vim costs a few bytes instead of a copy of the
+    whole plugin tree.
+
+    With a pool, files are stored by its workers while the tree is still
+    being walked. A file that cannot be stored is reported and left out of
+    the snapshot; the rest of the target is still backed up.
+
+    Args:
+        file_path: File or directory to back up
+        backup_dir: Snapshot directory
+        manifest: Snapshot manifest, updated in place (only by this call's
+                  thread: concurrent calls each get their own)
+        previous: Manifest of the previous snapshot, used to skip unchanged files
+        archive: Open archive_writer() for "archive" mode
+        keys: Only record these snapshot keys, if they exist (partial snapshot)
+        pool: Executor to store files on (default: store them inline)
+        name: Snapshot key of the target (default its file name)
+
     Returns True if backup was created, False otherwise.
     """
+    import stat
+    import tarfile
+    from concurrent.futures import Future
+
     source = Path(file_path).expanduser()
-    if not source.exists():
+    if not (source.exists() or source.is_symlink()):
         return False
 
-    # Use the original filename in the backup directory
-    backup_path = backup_dir / source.name
+    files = manifest["files"]
+    new_bytes = 0
+    file_count = 0
+    stored: List[Tuple[str, Path, "Future[Tuple[Dict[str, Any], int]]"]] = []
+
+    # Use the original filename as the snapshot key, unless given one
+    name = name or source.name
+    if keys is None:
+        entries = walk_target(source, name)
+    else:
+        selected = [
+            (key, entry_path(source, name, key)) for key in sorted(keys) if key == name or key.startswith(f"{name}/")
+        ]
+        # Never follow a symlink (e.g. ~/.vim -> dotfiles/vim) into what it points to
+        selected = [
+            (key, path)
+            for key, path in selected
+            if (path.exists() or path.is_symlink()) and not below_symlink(source, path)
+        ]
+        if not selected:
+            return False
+        entries = ((key, path, path.lstat()) for key, path in selected)
+    manifest["roots"][name] = str(source)
 
     try:
-        if source.is_dir():
-            shutil.copytree(source, backup_path)
-            print(f" Backed up directory: {source} -> {backup_path}")
-        else:
-            shutil.copy2(source, backup_path)
-            print(f" Backed up file: {source} -> {backup_path}")
-        return True
+        for key, path, st in entries:
+            mode = stat.S_IMODE(st.st_mode)
+            if stat.S_ISLNK(st.st_mode):
+                files[key] = {"type": "link", "target": os.readlink(path)}
+                if archive is not None:
+                    info = tarfile.TarInfo(key)
+                    info.type = tarfile.SYMTYPE
+                    info.linkname = files[key]["target"]
+                    info.mtime = int(st.st_mtime)
+                    archive.addfile(info)
+            elif stat.S_ISDIR(st.st_mode):
+                files[key] = {"type": "dir", "mode": mode}
+                if manifest["layout"] == "tree":
+                    (backup_dir / key).mkdir(parents=True, exist_ok=True)
+                elif archive is not None:
+                    info = tarfile.TarInfo(key)
+                    info.type = tarfile.DIRTYPE
+                    info.mode = mode
+                    info.mtime = int(st.st_mtime)
+                    archive.addfile(info)
+            elif stat.S_ISREG(st.st_mode):
+                files[key] = {}  # Placeholder keeps walk order until the file is stored
+                job = (path, st, key, backup_dir, previous, archive)
+                if pool is not None:
+                    stored.append((key, path, pool.submit(store_file, *job)))
+                    continue
+                future: "Future[Tuple[Dict[str, Any], int]]" = Future()
+                try:
+                    future.set_result(store_file(*job))
+                except OSError as e:
+                    future.set_exception(e)
+                stored.append((key, path, future))
+    except ArchiveAborted:
+        raise
     except Exception as e:
         print(f" Warning: Failed to backup {source}: {e}")
+        for key, _, future in stored:
+            future.cancel()
+            files.pop(key, None)
+        return False
+
+    failed = 0
+    for key, path, future in stored:
+        try:
+            files[key], written = future.result()
+        except OSError as e:
+            del files[key]
+            failed += 1
+            print(f" Warning: Failed to backup {path}: {e}")
+            continue
+        new_bytes += written
+        file_count += 1
+
+    if source.is_symlink():
+        print(f" Backed up link: {source} -> {files[name]['target']}")
+    elif source.is_dir():
+        failures = f", {failed} failed" if failed else ""
+        print(f" Backed up directory: {source} ({file_count} files, {new_bytes} new bytes{failures})")
+    elif failed:
         return False
+    else:
+        print(f" Backed up file: {source} ({new_bytes} new bytes)")
+    return True
 
 
-def collect_system_data() -> None:
+def run_probe(argv: List[str], stream: str = "stdout", timeout: Optional[float] = None) -> str:
     """
-    Collect and populate system information into SYS_DATA global.
+    Execute a command directly (no shell) and return the first line it writes.
+
+    Only the first line of the selected stream is read; the process is then
+    reaped without consuming the rest of its output.
+
+    Args:
+        argv: Command and arguments
+        stream: Which output to read, "stdout" or "stderr"
+        timeout: Seconds before the process is killed (default SETTINGS["probe_timeout"])
 
-    Detects OS (Linux/macOS/Windows), architecture, shell type/version,
-    and installed tool versions (vim, nvim, tmux, ssh, gpg).
+    Raises:
+        FileNotFoundError: If the command is not installed
+        subprocess.TimeoutExpired: If no line arrives within timeout
     """
-    global SYSTEM
-    home = Path.home()
-    nvim_config = Path(os.environ.get("XDG_CONFIG_HOME", str(home / ".config")))
-    script_dir = get_script_path()
-    script_file = Path(__file__).name
-    os_kind = platform.system()  # Linux, Darwin, Windows
-    os_release = platform.release()
-    arch = platform.machine()  # x86_64, i686, armv7l, aarch64, etc.
-
-    # Get OS-specific information
-    if os_kind == "Linux":
+    import signal
+    import subprocess
+    import threading
+
+    if timeout is None:
+        timeout = SETTINGS["probe_timeout"]
+    want_stderr = stream == "stderr"
+    proc = subprocess.Popen(
+        argv,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL if want_stderr else subprocess.PIPE,
+        stderr=subprocess.PIPE if want_stderr else subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    pipe = proc.stderr if want_stderr else proc.stdout
+    assert pipe is not None
+
+    def kill_group() -> None:
+        # Kill the whole process group, children of a wrapper script may hold the pipe open
         try:
-            # Read /etc/os-release file (standard on most modern Linux distros)
-            with open("/etc/os-release") as f:
-                os_release_data = {}
-                for line in f:
-                    if "=" in line:
-                        key, value = line.strip().split("=", 1)
-                        # Remove quotes from value
-                        os_release_data[key] = value.strip('"')
-
-                os_name = os_release_data.get("NAME", "Linux")
-                os_version = os_release_data.get("VERSION_ID", platform.release())
-                os_codename = os_release_data.get("VERSION_CODENAME", os_release_data.get("CODENAME", None))
-        except (FileNotFoundError, PermissionError):
-            os_name = "Linux"
-            os_version = platform.release()
-            os_codename = None
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
 
-    elif os_kind == "Darwin":
-        # macOS
-        mac_ver = platform.mac_ver()[0]  # e.g., '12.6.0' or '13.0.1'
-        os_version = mac_ver
-        os_name = "macOS"
-        os_codename = None
+    # readline() blocks, so a timer kills a hung tool to unblock it
+    timer = threading.Timer(timeout, kill_group)
+    timer.start()
+    try:
+        line = pipe.readline()
+    finally:
+        timer.cancel()
+        pipe.close()
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        kill_group()
+        proc.wait()
+    if not line and proc.returncode == -signal.SIGKILL:
+        raise subprocess.TimeoutExpired(argv, timeout)
+    return line.decode("utf-8", errors="replace").strip()
 
-    elif os_kind == "Windows":
-        # Windows
-        win_ver = platform.win32_ver()
-        release, version, csd, _ = win_ver
-        os_version = version  # e.g., '10.0.19041'
 
-        # Distinguish Windows 11 from Windows 10 by build number
-        try:
-            version_parts = version.split(".")
-            major = int(version_parts[0])
-            build = int(version_parts[2]) if len(version_parts) > 2 else 0
+def probe_version(definition: Dict[str, Any], shell: Optional[str]) -> Optional[str]:
+    """
+    Run one probe from SETTINGS["probes"] and parse the version from its first line.
 
-            if major == 10 and build >= 22000:
-                os_name = "Windows 11"
-            else:
-                os_name = f"Windows {release}" if release else "Windows"
-        except (ValueError, IndexError):
-            os_name = f"Windows {release}" if release else "Windows"
-        os_codename = csd if csd else None  # Service pack info
+    Args:
+        definition: Probe definition with argv, stream and regex keys
+        shell: Name of the current shell, substituted for "{shell}" in argv
 
-    else:
-        # Unknown/Other OS
-        os_name = os_kind
-        os_version = platform.release()
-        os_codename = None
-
-    # Initialize SystemData
-    SYSTEM = SystemData(
-        home=home,
-        nvim_config=nvim_config,
-        script_dir=script_dir,
-        script_file=script_file,
-        os_kind=os_kind,
-        os_release=os_release,
-        arch=arch,
-        os_name=os_name,
-        os_version=os_version,
-        os_codename=os_codename,
-        shell=None,
-    )
+    Returns:
+        First regex group of the first output line, or None if it did not match
+    """
+    argv = [arg.format(shell=shell) for arg in definition["argv"]]
+    line = run_probe(argv, definition.get("stream", "stdout"))
+    match = re.search(definition["regex"], line)
+    return match.group(1) if match else None
 
-    # Get current shell
-    shell_path = os.environ.get("SHELL", "")
-    if shell_path:
-        SYSTEM.shell = shell_path.split("/")[-1] if shell_path else None
-    else:
-        try:
-            # Get parent process (the shell that launched this script)
-            ppid = os.getppid()
-            SYSTEM.shell = subprocess.check_output(f"ps -p {ppid} -o comm=", shell=True).decode("ascii").strip()
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            SYSTEM.shell = None
 
-    # Get shell version
-    try:
-        if SYSTEM.shell in ["bash", "zsh"]:
-            version_output = subprocess.check_output(f"{SYSTEM.shell} --version", shell=True).decode("ascii").strip()
-            # Extract version number from first line
-            SYSTEM.version["shell"] = (
-                version_output.split("\n")[0].split()[3] if SYSTEM.shell == "bash" else version_output.split()[1]
-            )
-        else:
-            SYSTEM.version["shell"] = None
-    except (subprocess.CalledProcessError, FileNotFoundError, IndexError):
-        SYSTEM.version["shell"] = None
+def get_cache_dir() -> Path:
+    """
+    Return the DotSetup cache directory ($XDG_CACHE_HOME/dotsetup).
+    """
+    return Path(os.environ.get("XDG_CACHE_HOME", str(Path.home() / ".cache"))) / "dotsetup"
 
-    # Vim version
-    try:
-        SYSTEM.version["vim"] = (
-            subprocess.check_output("vim --version | head -1 | cut -d ' ' -f 5", shell=True).decode("ascii").strip()
-            or None
-        )
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        SYSTEM.version["vim"] = None
 
-    # Neovim version
-    try:
-        SYSTEM.version["nvim"] = (
-            subprocess.check_output("nvim --version | head -1 | cut -d ' ' -f 2", shell=True)
-            .decode("ascii")
-            .strip()[1:]
-            or None
-        )
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        SYSTEM.version["nvim"] = None
+def binary_identity(command: str) -> Optional[Dict[str, Any]]:
+    """
+    Identify the binary a command name resolves to on $PATH.
+
+    The identity is the resolved path plus inode, size and mtime, so it
+    changes whenever the binary is upgraded or a different one shadows it.
+
+    Returns:
+        Dictionary with path, inode, size and mtime, or None if not installed
+    """
+    import shutil
 
-    # tmux version
+    found = shutil.which(command)
+    if not found:
+        return None
+    resolved = os.path.realpath(found)
     try:
-        SYSTEM.version["tmux"] = (
-            subprocess.check_output("tmux -V | cut -d ' ' -f 2", shell=True).decode("ascii").strip() or None
-        )
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        SYSTEM.version["tmux"] = None
+        st = os.stat(resolved)
+    except OSError:
+        return None
+    return {"path": resolved, "inode": st.st_ino, "size": st.st_size, "mtime": st.st_mtime_ns}
+
+
+def load_probe_cache() -> Dict[str, Any]:
+    """
+    Load cached probe results, or an empty cache if missing or unreadable.
+    """
+    import json
 
-    # SSH version
     try:
-        ssh_output = subprocess.check_output("ssh -V 2>&1 | head -1", shell=True).decode("ascii").strip()
-        # SSH version is like "OpenSSH_8.2p1 Ubuntu-4ubuntu0.5, OpenSSL 1.1.1f  31 Mar 2020"
-        SYSTEM.version["ssh"] = ssh_output.split()[0].replace("OpenSSH_", "").split(",")[0]
-    except (subprocess.CalledProcessError, FileNotFoundError, IndexError):
-        SYSTEM.version["ssh"] = None
+        with open(get_cache_dir() / "probes.json", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
 
-    # GPG version
+def save_probe_cache(cache: Dict[str, Any]) -> None:
+    """
+    Atomically write probe results to the cache file. Failures are ignored,
+    the cache is only an optimization.
+    """
+    import json
+
+    cache_file = get_cache_dir() / "probes.json"
+    tmp_file = cache_file.with_name(f"{cache_file.name}.{os.getpid()}.tmp")
     try:
-        SYSTEM.version["gpg"] = (
-            subprocess.check_output("gpg --version | head -1 | cut -d ' ' -f 3", shell=True).decode("ascii").strip()
-            or None
-        )
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        SYSTEM.version["gpg"] = None
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        try:
+            tmp_file.unlink()
+        except OSError:
+            pass
+
+
+def probe_versions(shell: Optional[str], refresh: bool = False) -> Dict[str, Optional[str]]:
+    """
+    Run every tool version probe in SETTINGS["probes"] concurrently.
+
+    Total wall time is roughly that of the slowest probe instead of the sum
+    of all of them. A probe that exceeds SETTINGS["probe_timeout"] reports
+    PROBE_TIMED_OUT; a missing or failing tool reports None.
+
+    Results are cached on disk keyed on the identity of the probed binary
+    (see binary_identity()), so only new or upgraded tools are re-probed.
+
+    Args:
+        shell: Name of the current shell (bash, zsh, ...)
+        refresh: Ignore cached results and re-probe every tool
+
+    Returns:
+        Dictionary of tool name to version string
+    """
+    import subprocess
+    from concurrent.futures import ThreadPoolExecutor
+
+    probes = SETTINGS["probes"]
+    cache = {} if refresh else load_probe_cache()
+    versions: Dict[str, Optional[str]] = {}
+    identities: Dict[str, Dict[str, Any]] = {}
+    pending: List[str] = []
+    for name, definition in probes.items():
+        binary = definition["argv"][0].format(shell=shell or "")
+        identity = binary_identity(binary) if binary else None
+        if identity is None:
+            # Not installed, nothing to spawn
+            versions[name] = None
+            continue
+        cached = cache.get(name)
+        if (
+            isinstance(cached, dict)
+            and cached.get("identity") == identity
+            and cached.get("definition") == definition
+        ):
+            versions[name] = cached.get("version")
+            continue
+        identities[name] = identity
+        pending.append(name)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=len(pending)) as pool:
+            futures = {name: pool.submit(probe_version, probes[name], shell) for name in pending}
+            for name, future in futures.items():
+                try:
+                    versions[name] = future.result()
+                except subprocess.TimeoutExpired:
+                    versions[name] = PROBE_TIMED_OUT
+                    continue  # Never cache a timeout, retry next run
+                except OSError:
+                    versions[name] = None
+                cache[name] = {"identity": identities[name], "definition": probes[name], "version": versions[name]}
+        save_probe_cache(cache)
+
+    return {name: versions[name] for name in probes}
+
+
+def collect_system_data(refresh: bool = False) -> None:
+    """
+    Reset the SYSTEM global to a fresh, lazily evaluated SystemData.
+
+    Nothing is detected here: OS, shell and tool versions are resolved on
+    first access, so commands that never display them never pay for them.
+
+    Args:
+        refresh: Re-probe tool versions instead of using cached results
+    """
+    global SYSTEM
+    SYSTEM = SystemData(refresh=refresh)
 
     # Set backup path to script directory (not ~/dotfiles which may not exist yet)
     SETTINGS["backup_path"] = str(SYSTEM.script_dir / "backup")
 
 
+def version_tuple(version: str) -> Tuple[int, ...]:
+    """
+    Parse the leading dotted numeric part of a version string.
+
+    Example: "3.3a" -> (3, 3), "9.6p1" -> (9, 6), "0.10.0-dev" -> (0, 10, 0)
+    """
+    match = re.match(r"\d+(?:\.\d+)*", version.strip())
+    return tuple(int(part) for part in match.group(0).split(".")) if match else ()
+
+
+def version_at_least(version: str, minimum: str) -> bool:
+    """
+    Return True if version >= minimum, comparing numeric components.
+
+    Missing components count as zero, so "8.0" == "8.0.0".
+    """
+    current = version_tuple(version)
+    wanted = version_tuple(minimum)
+    width = max(len(current), len(wanted))
+    return current + (0,) * (width - len(current)) >= wanted + (0,) * (width - len(wanted))
+
+
 def display_system_data() -> None:
     """
     Display current system information in a formatted box.
@@ -424,9 +1261,14 @@ def display_system_data() -> None:
 
     def version_line(name, version, recommended, v_pad: int = 0, r_pad: int | None = 0) -> str:
         current = False
+        if version == PROBE_TIMED_OUT:
+            return f"{Colors.YELLOW}?{Colors.RESET} {name}:  {version:{v_pad}}"
+        if recommended is None:
+            # Informational only, no recommended version to check against
+            return f"{Colors.CYAN}•{Colors.RESET} {name}:  {version or 'Not detected':{v_pad}}"
         if version:
             version = version.split("p")[0].split("-")[0].split("(")[0]
-            current = parse_version(version) >= parse_version(recommended)
+            current = version_at_least(version, recommended)
         else:
             version = "Not detected"
         if current:
@@ -472,13 +1314,16 @@ def display_system_data() -> None:
     lines.extend([
         "\x01 VERSIONS",
         f"Shell Name:  {SYSTEM.shell}",
-        version_line("shell   ", SYSTEM.version["shell"], SETTINGS["recommended"]["shell"], v_pad=6),
-        version_line("Vim     ", SYSTEM.version["vim"], SETTINGS["recommended"]["vim"], v_pad=6),
-        version_line("NeoVim  ", SYSTEM.version["nvim"], SETTINGS["recommended"]["nvim"], v_pad=6),
-        version_line("Tmux    ", SYSTEM.version["tmux"], SETTINGS["recommended"]["tmux"], v_pad=6),
-        version_line("SSH     ", SYSTEM.version["ssh"], SETTINGS["recommended"]["ssh"], v_pad=6),
-        version_line("GPG     ", SYSTEM.version["gpg"], SETTINGS["recommended"]["gpg"], v_pad=6),
     ])
+    for name, definition in SETTINGS["probes"].items():
+        lines.append(
+            version_line(
+                f"{definition.get('label', name):8}",
+                SYSTEM.version.get(name),
+                SETTINGS["recommended"].get(name),
+                v_pad=6,
+            )
+        )
 
     box_draw(lines, title="OS")
 
@@ -557,219 +1402,282 @@ def ask_user_data() -> UserData:
     )
 
 
-def create_user_vim(user: Optional[UserData]) -> None:
+class Change(NamedTuple):
     """
-    Generate vim/user.vim with user-specific vim variables.
-
-    Creates variables: g:_NAME_, g:_USER_, g:_COMPANY_, g:_EMAIL_, g:_VIM_
-    These can be used in vim configuration for personalization.
-
-    Args:
-        user: User data dictionary, or None to skip creation
+    One difference between the desired and the actual state, and how to fix it.
     """
-    if not user:
-        return
-    print("Creating user.vim")
 
-    vim_user_path = Path(f"{SETTINGS['dotfiles']}/vim/user.vim").expanduser()
-    with open(vim_user_path, "w") as f:
-        f.write(f"let g:_NAME_    = '{user.name}'\n")
-        f.write(f"let g:_USER_    = '{user.user}'\n")
-        f.write(f"let g:_COMPANY_ = '{user.company}'\n")
-        f.write(f"let g:_EMAIL_   = '{user.email}'\n")
-        f.write(f"let g:_VIM_     = '{user.vim}'\n")
+    target: Path
+    action: str  # What apply() does, e.g. "create", "update", "symlink -> {src}"
+    apply: Callable[[], None]
 
 
-def create_user_git(user: Optional[UserData]) -> None:
+def file_change(path: Path, content: str, mode: Optional[int] = None) -> List[Change]:
     """
-    Create git/gitconfig with user information and standard configuration.
+    Plan writing a text file, only if its contents differ.
 
-    Includes user name/email, aliases (s, logpretty, logshort),
-    fast-forward-only pulls, and 8-hour credential caching.
+    Symlinks are written through, not replaced.
 
     Args:
-        user: User data dictionary with name, email, vim keys
+        path: File to write
+        content: Desired contents
+        mode: Permissions for a newly created file
     """
-    print("Creating gitconfig")
+    try:
+        with open(path, encoding="utf-8") as f:
+            if f.read() == content:
+                return []
+        action = "update"
+    except FileNotFoundError:
+        action = "create"
 
-    git_config_path = Path(f"{SETTINGS['dotfiles']}/git/gitconfig").expanduser()
-    with open(git_config_path, "w", encoding="utf-8") as f:
-        f.write(
-            "\n".join(
-                [
-                    "[user]",
-                    f"	name  = {user.name}" if user else "",
-                    f"	email = {user.email}" if user else "",
-                    "[core]",
-                    f"	editor = {user.vim}" if user else "",
-                    "	autocrlf = input",
-                    "[help]",
-                    "	autocorrect = 1",
-                    "[color]",
-                    "	ui          = auto",
-                    "	branch      = auto",
-                    "	diff        = auto",
-                    "	interactive = auto",
-                    "	status      = auto",
-                    "	grep        = auto",
-                    "	pager       = true",
-                    "	decorate    = auto",
-                    "	showbranch  = auto",
-                    "[push]",
-                    "	default     = simple",
-                    "[credential]",
-                    "	helper      = cache --timeout=28800",  # Don't ask for a password for 8 hours
-                    "[alias]",
-                    "	s             = status",
-                    "	export        = archive -o latest.tar.gz -9 --prefix=latest/",
-                    "	details       = log -n1 -p --format=fuller",
-                    r"	logpretty    = log --graph --decorate --pretty=format:'%C(yellow)%h%Creset%C(auto)%d%n%Creset %s %C(green)(%cr) %C(blue)<%an>%Creset'",
-                    r"	logshort     = log --graph --decorate --pretty=format:'%C(yellow)%h%Creset -%C(auto)%h %d%Creset %s %C(green)(%cr) %C(blue)<%an>%Creset' --abbrev-commit",
-                    "	stats-commits = shortlog -sn --no-merges",  # Shows number of lines / commit by author for the current branch
-                    "[pull]",
-                    "	ff = only",
-                    "[init]",
-                    "\tdefaultBranch = main",
-                    "",  # Ends in newline
-                ]
-            )
-        )
+    def apply() -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        if mode is not None and action == "create":
+            path.chmod(mode)
 
+    return [Change(path, action, apply)]
 
-def link_user_git(user: Optional[UserData]) -> None:
+
+def link_change(src: Path, dest: Path) -> List[Change]:
     """
-    Link or update ~/.gitconfig with dotfiles configuration.
+    Plan a symlink dest -> src, only if dest is not already that link.
+    """
+    if dest.is_symlink() and Path(os.readlink(dest)) == src:
+        return []
+    action = "replace with symlink" if dest.exists() or dest.is_symlink() else "symlink"
+    return [Change(dest, f"{action} -> {src}", lambda: safe_symlink(src, dest))]
+
+
+def plan_dotfiles_symlink() -> List[Change]:
+    """
+    Ensure ~/dotfiles symlink points to the actual script directory.
+
+    If the script is running from a location other than ~/dotfiles,
+    creates a symlink ~/dotfiles -> {actual_script_location}.
+    This allows the dotfiles to be located anywhere while maintaining
+    the expected ~/dotfiles path for exports and references.
+
+    Raises:
+        SystemExit: If ~/dotfiles is a different directory
+    """
+    dotfiles_path = SYSTEM.home / "dotfiles"
+    script_dir = SYSTEM.script_dir.resolve()
+
+    # A symlink that resolves to the script directory is fine as it is
+    if dotfiles_path.is_symlink() and dotfiles_path.resolve() == script_dir:
+        return []
+    if dotfiles_path.is_symlink() or not dotfiles_path.exists():
+        return link_change(script_dir, dotfiles_path)
+
+    # If it's a directory other than script_dir, the user has to sort it out
+    if dotfiles_path.is_dir() and dotfiles_path.resolve() != script_dir:
+        print(f"\nWarning: ~/dotfiles exists as a directory but is not the script location")
+        print(f"  Expected: {script_dir}")
+        print(f"  Found:    {dotfiles_path.resolve()}")
+        print(f"  Please manually resolve this conflict")
+        sys.exit(1)
+    return []
+
+
+def plan_user_vim(user: Optional[UserData]) -> List[Change]:
+    """
+    Generate vim/user.vim with user-specific vim variables.
+
+    Creates variables: g:_NAME_, g:_USER_, g:_COMPANY_, g:_EMAIL_, g:_VIM_
+    These can be used in vim configuration for personalization.
+
+    Args:
+        user: User data dictionary, or None to skip creation
+    """
+    if not user:
+        return []
+
+    vim_user_path = Path(f"{SETTINGS['dotfiles']}/vim/user.vim").expanduser()
+    return file_change(
+        vim_user_path,
+        "".join(
+            [
+                f"let g:_NAME_    = '{user.name}'\n",
+                f"let g:_USER_    = '{user.user}'\n",
+                f"let g:_COMPANY_ = '{user.company}'\n",
+                f"let g:_EMAIL_   = '{user.email}'\n",
+                f"let g:_VIM_     = '{user.vim}'\n",
+            ]
+        ),
+    )
+
+
+def plan_user_git(user: Optional[UserData]) -> List[Change]:
+    """
+    Create git/gitconfig with user information and standard configuration.
+
+    Includes user name/email, aliases (s, logpretty, logshort),
+    fast-forward-only pulls, and 8-hour credential caching.
+
+    Args:
+        user: User data dictionary with name, email, vim keys, or None to
+              keep an existing file (it may already hold user info)
+    """
+    git_config_path = Path(f"{SETTINGS['dotfiles']}/git/gitconfig").expanduser()
+    if not user and git_config_path.is_file():
+        return []
+    return file_change(
+        git_config_path,
+        "\n".join(
+            [
+                "[user]",
+                f"	name  = {user.name}" if user else "",
+                f"	email = {user.email}" if user else "",
+                "[core]",
+                f"	editor = {user.vim}" if user else "",
+                "	autocrlf = input",
+                "[help]",
+                "	autocorrect = 1",
+                "[color]",
+                "	ui          = auto",
+                "	branch      = auto",
+                "	diff        = auto",
+                "	interactive = auto",
+                "	status      = auto",
+                "	grep        = auto",
+                "	pager       = true",
+                "	decorate    = auto",
+                "	showbranch  = auto",
+                "[push]",
+                "	default     = simple",
+                "[credential]",
+                "	helper      = cache --timeout=28800",  # Don't ask for a password for 8 hours
+                "[alias]",
+                "	s             = status",
+                "	export        = archive -o latest.tar.gz -9 --prefix=latest/",
+                "	details       = log -n1 -p --format=fuller",
+                r"	logpretty    = log --graph --decorate --pretty=format:'%C(yellow)%h%Creset%C(auto)%d%n%Creset %s %C(green)(%cr) %C(blue)<%an>%Creset'",
+                r"	logshort     = log --graph --decorate --pretty=format:'%C(yellow)%h%Creset -%C(auto)%h %d%Creset %s %C(green)(%cr) %C(blue)<%an>%Creset' --abbrev-commit",
+                "	stats-commits = shortlog -sn --no-merges",  # Shows number of lines / commit by author for the current branch
+                "[pull]",
+                "	ff = only",
+                "[init]",
+                "\tdefaultBranch = main",
+                "",  # Ends in newline
+            ]
+        ),
+    )
+
+
+def plan_link_user_git(user: Optional[UserData]) -> List[Change]:
+    """
+    Link or update ~/.gitconfig with dotfiles configuration.
 
     If ~/.gitconfig exists, updates it with user info and key settings.
+    It is only rewritten when a setting actually changes.
     Otherwise, creates symlink to {dotfiles}/git/gitconfig.
 
     Args:
         user: User data dictionary, or None to skip user info updates
     """
-    print("linking or editing users gitconfig")
+    import configparser
+
     # Check if a config file already exists in the home folder, If it does
     # the file we created will not be linked so lets just edit the existing file
-    config_file = (SYSTEM.home / ".gitconfig").expanduser()
-    if config_file.is_file() or config_file.is_symlink():
-        print("~/.gitconfig Already exists updating")
-        config = configparser.ConfigParser()
-        config.read(config_file)
-
-        # Update user information if provided
-        if user:
-            if "user" in config:
-                if "name" in config["user"]:
-                    config["user"]["name"] = user.name
-                if "email" in config["user"]:
-                    config["user"]["email"] = user.email
-            else:
-                config["user"] = {"name": user.name, "email": user.email}
+    config_file = SYSTEM.home / ".gitconfig"
+    if not (config_file.is_file() or config_file.is_symlink()):
+        # File does not exist, create symlink
+        return link_change(SYSTEM.script_dir / "git" / "gitconfig", config_file)
+
+    config = configparser.ConfigParser()
+    config.read(config_file)
+
+    def settings() -> Dict[str, Dict[str, str]]:
+        return {section: dict(config.items(section, raw=True)) for section in config.sections()}
 
-        if "alias" not in config:
-            config["alias"] = {}
-        config["alias"]["s"] = "status"
+    before = settings()
 
-        if "pull" not in config:
-            config["pull"] = {}
-        config["pull"]["ff"] = "only"
+    # Update user information if provided
+    if user:
+        if "user" in config:
+            if "name" in config["user"]:
+                config["user"]["name"] = user.name
+            if "email" in config["user"]:
+                config["user"]["email"] = user.email
+        else:
+            config["user"] = {"name": user.name, "email": user.email}
+
+    if "alias" not in config:
+        config["alias"] = {}
+    config["alias"]["s"] = "status"
+
+    if "pull" not in config:
+        config["pull"] = {}
+    config["pull"]["ff"] = "only"
+
+    if "init" not in config:
+        config["init"] = {}
+    config["init"]["defaultBranch"] = "main"
 
-        if "init" not in config:
-            config["init"] = {}
-        config["init"]["defaultBranch"] = "main"
+    if "credential" not in config:
+        config["credential"] = {}
+    if "helper" not in config["credential"]:
+        config["credential"]["helper"] = "cache --timeout=28800"
 
-        if "credential" not in config:
-            config["credential"] = {}
-        if "helper" not in config["credential"]:
-            config["credential"]["helper"] = "cache --timeout=28800"
+    if settings() == before:
+        return []
 
+    def apply() -> None:
         with open(config_file, "w") as file:
             config.write(file)
-    else:
-        # File does not exist, create symlink
-        src = (SYSTEM.script_dir / "git" / "gitconfig").expanduser()
-        dest = Path("~/.gitconfig").expanduser()
-        safe_symlink(src, dest)
+
+    return [Change(config_file, "update", apply)]
 
 
-def create_folders() -> None:
+def plan_folders() -> List[Change]:
     """
     Create required directories for dotfiles operation.
 
     Creates:
     - ~/.config/nvim/ for neovim configuration
+    - ~/.ssh/ (mode 700) if it doesn't exist
     - ~/.ssh/controlmasters/ (mode 700) for SSH connection multiplexing
     """
+    changes = []
+
     # Neovim config directory
-    nvim_dir = (SYSTEM.home / ".config" / "nvim").expanduser()
+    nvim_dir = SYSTEM.home / ".config" / "nvim"
     if not nvim_dir.exists():
-        nvim_dir.mkdir(parents=True, exist_ok=True)
-        print(f"Created {nvim_dir}")
+        changes.append(Change(nvim_dir, "create directory", lambda: nvim_dir.mkdir(parents=True, exist_ok=True)))
 
-    # SSH controlmasters directory for SSH connection multiplexing
-    ssh_control_dir = (SYSTEM.home / ".ssh" / "controlmasters").expanduser()
-    if not ssh_control_dir.exists():
-        ssh_control_dir.mkdir(parents=True, exist_ok=True)
-        ssh_control_dir.chmod(0o700)  # Secure permissions
-        print(f"Created {ssh_control_dir} with mode 700")
+    # ~/.ssh itself, before anything is created inside it
+    ssh_dir = SYSTEM.home / ".ssh"
+    if not ssh_dir.exists():
 
+        def create_ssh_dir() -> None:
+            ssh_dir.mkdir(mode=0o700, exist_ok=True)
+            ssh_dir.chmod(0o700)  # Secure permissions, whatever the umask
 
-def ensure_dotfiles_symlink() -> None:
-    """
-    Ensure ~/dotfiles symlink points to the actual script directory.
-    
-    If the script is running from a location other than ~/dotfiles,
-    creates a symlink ~/dotfiles -> {actual_script_location}.
-    This allows the dotfiles to be located anywhere while maintaining
-    the expected ~/dotfiles path for exports and references.
-    """
-    dotfiles_path = (SYSTEM.home / "dotfiles").expanduser()
-    script_dir = SYSTEM.script_dir.resolve()
+        changes.append(Change(ssh_dir, "create directory (mode 700)", create_ssh_dir))
 
-    # If ~/dotfiles doesn't exist, create symlink
-    if not dotfiles_path.exists():
-        print(f"\nCreating symlink: ~/dotfiles -> {script_dir}")
-        dotfiles_path.symlink_to(script_dir)
-        return
+    # SSH controlmasters directory for SSH connection multiplexing
+    ssh_control_dir = ssh_dir / "controlmasters"
+    if not ssh_control_dir.exists():
 
-    # If it's a symlink, check if it points to the right place
-    if dotfiles_path.is_symlink():
-        current_target = dotfiles_path.resolve()
-        if current_target != script_dir:
-            print(f"\nUpdating ~/dotfiles symlink")
-            print(f"  Old target: {current_target}")
-            print(f"  New target: {script_dir}")
-            dotfiles_path.unlink()
-            dotfiles_path.symlink_to(script_dir)
-        else:
-            print(f"\n~/dotfiles symlink already points to correct location")
-        return
+        def create_control_dir() -> None:
+            ssh_control_dir.mkdir(exist_ok=True)
+            ssh_control_dir.chmod(0o700)  # Secure permissions
 
-    # If it's a directory and matches script_dir, we're running from ~/dotfiles
-    if dotfiles_path.is_dir():
-        if dotfiles_path.resolve() == script_dir:
-            print(f"\n~/dotfiles is already the script directory")
-        else:
-            print(f"\nWarning: ~/dotfiles exists as a directory but is not the script location")
-            print(f"  Expected: {script_dir}")
-            print(f"  Found:    {dotfiles_path.resolve()}")
-            print(f"  Please manually resolve this conflict")
-            sys.exit(1)
+        changes.append(Change(ssh_control_dir, "create directory (mode 700)", create_control_dir))
+    return changes
 
 
-def configure_ssh_multiplexing() -> None:
+def plan_ssh_multiplexing() -> List[Change]:
     """
     Configure SSH connection multiplexing in ~/.ssh/config.
 
     Adds ControlMaster, ControlPath, and ControlPersist settings if not already present.
-    Creates ~/.ssh/config if it doesn't exist.
+    Creates ~/.ssh/config (mode 600) if it doesn't exist; ~/.ssh itself is
+    created by plan_folders().
     """
-    ssh_config_path = (SYSTEM.home / ".ssh" / "config").expanduser()
-
-    # Ensure .ssh directory exists with proper permissions
-    ssh_dir = ssh_config_path.parent
-    if not ssh_dir.exists():
-        ssh_dir.mkdir(mode=0o700, parents=True)
-        print(f"Created {ssh_dir} with mode 700")
+    ssh_config_path = SYSTEM.home / ".ssh" / "config"
 
     # Configuration lines to add
     config_lines = [
@@ -780,292 +1688,2290 @@ def configure_ssh_multiplexing() -> None:
         "\n",
     ]
 
-    # Create file if it doesn't exist
-    if not ssh_config_path.exists():
-        print("Creating ~/.ssh/config with SSH multiplexing settings")
-        with open(ssh_config_path, "w") as f:
-            f.writelines(config_lines)
-        ssh_config_path.chmod(0o600)  # Secure permissions
-        return
-
-    # Read existing config
-    with open(ssh_config_path) as f:
-        existing_content = f.read()
+    try:
+        with open(ssh_config_path) as f:
+            existing_content = f.read()
+    except FileNotFoundError:
+        return file_change(ssh_config_path, "".join(config_lines), mode=0o600)
 
     # Check if multiplexing is already configured
-    has_control_master = "ControlMaster" in existing_content
-    has_control_path = "ControlPath" in existing_content
-    has_control_persist = "ControlPersist" in existing_content
+    if all(option in existing_content for option in ("ControlMaster", "ControlPath", "ControlPersist")):
+        return []
 
-    if has_control_master and has_control_path and has_control_persist:
-        print("SSH multiplexing already configured in ~/.ssh/config")
-        return
+    # Append missing configuration, adding a newline if the file doesn't end with one
+    if existing_content and not existing_content.endswith("\n"):
+        existing_content += "\n"
+    return file_change(ssh_config_path, existing_content + "".join(config_lines))
+
+
+class VimPlugin(NamedTuple):
+    """
+    A plugin registered with minpac#add() in the vim config.
+    """
+
+    repo: str  # "owner/name", or a clone URL
+    name: str  # Directory name under vim/pack/minpac/{start,opt}/
+    kind: str  # "start" (loaded automatically) or "opt" (loaded with :packadd)
+    branch: Optional[str]
+
+    @property
+    def url(self) -> str:
+        if "://" in self.repo or self.repo.startswith(("/", "git@")):
+            return self.repo
+        return SETTINGS["plugin_url"].format(repo=self.repo)
+
+    @property
+    def path(self) -> Path:
+        return SYSTEM.script_dir / "vim" / "pack" / "minpac" / self.kind / self.name
 
-    # Append missing configuration
-    print("Adding SSH multiplexing settings to ~/.ssh/config")
-    with open(ssh_config_path, "a") as f:
-        # Add newline if file doesn't end with one
-        if existing_content and not existing_content.endswith("\n"):
-            f.write("\n")
-        f.writelines(config_lines)
 
-    print(" Added: ControlMaster auto")
-    print(" Added: ControlPath ~/.ssh/controlmasters/%r@%h:%p")
-    print(" Added: ControlPersist 10m")
+@lru_cache(maxsize=None)
+def vim_plugins() -> Tuple[VimPlugin, ...]:
+    """
+    Read the plugin list from the minpac#add() calls in SETTINGS["plugin_config"].
 
+    Understands the 'type', 'name' and 'branch' options of minpac#add(), e.g.
+    `call minpac#add('k-takata/minpac', {'type': 'opt'})`.
 
-def install_minpac() -> None:
+    Raises:
+        OSError: If the vim config cannot be read
     """
-    Install minpac plugin manager if not already present
+    plugins: Dict[str, VimPlugin] = {}
+    with open(SYSTEM.script_dir / SETTINGS["plugin_config"]) as f:
+        for line in f:
+            match = re.match(r"\s*call\s+minpac#add\(\s*'([^']+)'\s*(?:,\s*\{([^}]*)\})?\s*\)", line)
+            if not match:
+                continue
+            repo = match.group(1)
+            options = dict(re.findall(r"'(\w+)'\s*:\s*'([^']*)'", match.group(2) or ""))
+            name = options.get("name") or re.sub(r"\.git$", "", repo.rstrip("/").rsplit("/", 1)[-1])
+            plugins[name] = VimPlugin(repo, name, options.get("type", "start"), options.get("branch"))
+    return tuple(plugins.values())
+
+
+def run_git(args: List[str]) -> str:
     """
-    minpac_dir = (SYSTEM.script_dir / "vim" / "pack" / "minpac" / "opt" / "minpac").expanduser()
+    Run git non-interactively and return its output.
 
-    if minpac_dir.exists() and (minpac_dir / ".git").exists():
-        print("minpac already installed")
-        return
+    Raises:
+        OSError: If git is missing or exits with an error (the message is
+                 git's first fatal/error line)
+    """
+    import subprocess
+
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0")  # Fail instead of asking for credentials
+    result = subprocess.run(["git", *args], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        lines = result.stderr.strip().splitlines()
+        errors = [line.split(":", 1)[1].strip() for line in lines if line.startswith(("fatal:", "error:"))]
+        message = (errors or lines or [f"exit status {result.returncode}"])[0]
+        raise OSError(f"git {args[2] if args[0] == '-C' else args[0]}: {message}")
+    return result.stdout
+
+
+def mirror_dir() -> Path:
+    """
+    Return the plugin mirror cache: SETTINGS["plugin_mirrors"], the
+    machine-wide SHARED_PLUGIN_MIRRORS when it exists and is readable, or
+    the per-user $XDG_CACHE_HOME/dotsetup/mirrors.
+    """
+    if SETTINGS["plugin_mirrors"]:
+        return Path(SETTINGS["plugin_mirrors"]).expanduser()
+    if SHARED_PLUGIN_MIRRORS.is_dir() and os.access(SHARED_PLUGIN_MIRRORS, os.R_OK | os.X_OK):
+        return SHARED_PLUGIN_MIRRORS
+    return get_cache_dir() / "mirrors"
+
+
+def mirror_path(url: str) -> Path:
+    """
+    Bare mirror of a repository in the mirror cache, named after its URL
+    (e.g. github.com/k-takata/minpac.git).
+    """
+    key = re.sub(r"^[\w+.-]+://|^[^/@]+@", "", url).replace(":", "/")
+    key = re.sub(r"\.git$", "", key.strip("/"))
+    return mirror_dir() / f"{key}.git"
+
+
+def refresh_mirror(plugin: VimPlugin) -> str:
+    """
+    Create or fetch the bare mirror of a plugin in the mirror cache.
+
+    Mirrors are append-only (see PLUGIN_MIRROR_CONFIG): a force-push or a
+    deleted branch upstream never removes objects that clones borrowing
+    from the mirror still need.
 
-    print("\nInstalling minpac plugin manager...")
-    minpac_dir.parent.mkdir(parents=True, exist_ok=True)
+    Returns:
+        "created" or "refreshed"
 
+    Raises:
+        OSError: If git fails
+    """
+    import shutil
+
+    path = mirror_path(plugin.url)
+    if path.is_dir():
+        # Also applied here for mirrors created before they were append-only
+        for key, value in PLUGIN_MIRROR_CONFIG.items():
+            run_git(["-C", str(path), "config", key, value])
+        run_git(["-C", str(path), "fetch", "--quiet"])
+        return "refreshed"
+
+    # Cloned aside and renamed, so other installs never see a partial mirror
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp{os.getpid()}")
+    config = [f"--config={key}={value}" for key, value in PLUGIN_MIRROR_CONFIG.items()]
     try:
-        subprocess.run(
-            [
-                "git",
-                "clone",
-                "--depth=1",
-                "https://github.com/k-takata/minpac.git",
-                str(minpac_dir),
-            ],
-            check=True,
+        run_git(["clone", "--quiet", "--mirror", *config, plugin.url, str(tmp_path)])
+        os.replace(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return "created"
+
+
+def load_plugin_lock() -> Dict[str, str]:
+    """
+    Read the plugin lockfile (SETTINGS["plugin_lock"]).
+
+    Returns:
+        Plugin name -> pinned commit; empty if there is no lockfile yet
+    """
+    import json
+
+    try:
+        with open(SYSTEM.script_dir / SETTINGS["plugin_lock"]) as f:
+            lock = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {name: entry["commit"] for name, entry in lock["plugins"].items()}
+
+
+def write_plugin_lock(pins: Dict[str, str]) -> None:
+    """
+    Replace the plugin lockfile with the given pins.
+
+    Args:
+        pins: Plugin name -> commit, for plugins in vim_plugins()
+    """
+    import json
+
+    plugins = {plugin.name: plugin for plugin in vim_plugins()}
+    lock = {
+        "format": 1,
+        "plugins": {name: {"repo": plugins[name].repo, "commit": commit} for name, commit in pins.items()},
+    }
+    lock_path = SYSTEM.script_dir / SETTINGS["plugin_lock"]
+    tmp_path = lock_path.with_name(f".{lock_path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp_path, lock_path)
+
+
+def checkout_head(path: Path) -> Optional[str]:
+    """
+    Commit checked out in a git working tree, read from .git without running git.
+
+    Returns:
+        The commit id, or None if it cannot be determined
+    """
+    git_dir = path / ".git"
+    try:
+        head = (git_dir / "HEAD").read_text().strip()
+        if not head.startswith("ref: "):
+            return head  # Detached, e.g. at a pinned commit
+        ref = head[len("ref: ") :]
+        try:
+            return (git_dir / ref).read_text().strip()
+        except FileNotFoundError:
+            with open(git_dir / "packed-refs") as f:
+                for line in f:
+                    if line.rstrip("\n").endswith(f" {ref}"):
+                        return line.split(" ", 1)[0]
+    except OSError:
+        pass
+    return None
+
+
+def has_commit(path: Path, commit: str) -> bool:
+    """
+    Whether a commit is available in a plugin clone (or the mirror it borrows from).
+    """
+    try:
+        run_git(["-C", str(path), "cat-file", "-e", f"{commit}^{{commit}}"])
+        return True
+    except OSError:
+        return False
+
+
+def sync_plugin(plugin: VimPlugin, update: bool = False, pin: Optional[str] = None) -> str:
+    """
+    Clone a plugin, check out its pinned commit, or fetch its latest commit.
+
+    A plugin with a mirror in the mirror cache is cloned from the mirror and
+    borrows its objects (`git clone --reference`), which needs no network and
+    almost no disk space; origin still points at the real repository. Other
+    plugins are shallow-cloned from their repository. A pinned commit is only
+    fetched when it is not available locally.
+
+    Args:
+        plugin: Plugin to install
+        update: Also fetch the latest commit of plugins that are already
+                installed (ignores `pin`)
+        pin: Commit to check out, from the plugin lockfile
+
+    Returns:
+        "installed", "installed from mirror", "updated", "up to date",
+        "present" or "checked out {commit}" (possibly after "installed")
+
+    Raises:
+        OSError: If git fails, or the plugin directory is not a git checkout
+    """
+    import shutil
+
+    path = plugin.path
+    # A clone that borrows from a mirror has full history, keep it that way
+    depth = [] if (path / ".git" / "objects" / "info" / "alternates").exists() else ["--depth=1"]
+    if (path / ".git").exists():
+        if update:
+            before = run_git(["-C", str(path), "rev-parse", "HEAD"])
+            run_git(["-C", str(path), "fetch", "--quiet", *depth, "origin", plugin.branch or "HEAD"])
+            # --keep refuses to discard local changes
+            run_git(["-C", str(path), "reset", "--quiet", "--keep", "FETCH_HEAD"])
+            return "up to date" if run_git(["-C", str(path), "rev-parse", "HEAD"]) == before else "updated"
+        if pin is None or checkout_head(path) == pin:
+            return "present"
+        result = None
+    else:
+        if path.exists():
+            raise OSError(f"{path} exists and is not a git checkout")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        branch = ["--branch", plugin.branch] if plugin.branch else []
+        mirror = mirror_path(plugin.url)
+        try:
+            if mirror.is_dir():
+                run_git(["clone", "--quiet", "--reference", str(mirror), *branch, str(mirror), str(path)])
+                run_git(["-C", str(path), "remote", "set-url", "origin", plugin.url])
+                result = "installed from mirror"
+                depth = []
+            else:
+                run_git(["clone", "--quiet", "--depth=1", *branch, plugin.url, str(path)])
+                result = "installed"
+        except BaseException:
+            shutil.rmtree(path, ignore_errors=True)  # No half-cloned plugins
+            raise
+        if update or pin is None or checkout_head(path) == pin:
+            return result
+
+    # Only fetch a pinned commit that is neither in the clone nor in its mirror
+    if not has_commit(path, pin):
+        run_git(["-C", str(path), "fetch", "--quiet", *depth, "origin", pin])
+    run_git(["-C", str(path), "checkout", "--quiet", "--detach", pin])
+    return f"{result}, checked out {pin[:7]}" if result else f"checked out {pin[:7]}"
+
+
+def map_plugins(function: Callable[[VimPlugin], str], plugins: Iterable[VimPlugin]) -> Dict[str, str]:
+    """
+    Run `function` on plugins in parallel, SETTINGS["jobs"] at a time, printing each result.
+
+    Returns:
+        Plugin name -> result of `function`, or "failed: {error}"
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def run(plugin: VimPlugin) -> Tuple[str, str]:
+        try:
+            result = function(plugin)
+        except OSError as e:
+            result = f"failed: {e}"
+        # One write per line, plugins finish in any order
+        sys.stdout.write(f" {plugin.name}: {result}\n")
+        return plugin.name, result
+
+    plugins = list(plugins)
+    if not plugins:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(SETTINGS["jobs"], len(plugins))) as pool:
+        return dict(pool.map(run, plugins))
+
+
+def sync_plugins(
+    plugins: Iterable[VimPlugin], update: bool = False, pins: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Install (and with `update`, fetch) plugins in parallel.
+
+    Args:
+        plugins: Plugins to sync
+        update: Fetch the latest commit of installed plugins
+        pins: Plugin name -> commit to check out (see load_plugin_lock())
+
+    Returns:
+        Plugin name -> result of sync_plugin(), or "failed: {error}"
+    """
+    pins = pins or {}
+    return map_plugins(lambda plugin: sync_plugin(plugin, update, pins.get(plugin.name)), plugins)
+
+
+def plan_plugins() -> List[Change]:
+    """
+    Install the vim plugins (minpac included) that are not installed yet, and
+    check out the commits pinned in the plugin lockfile.
+
+    Reads only the plugins' .git/HEAD, so a converged tree costs no git commands.
+    """
+    pins = load_plugin_lock()
+    missing = []
+    moved = []
+    for plugin in vim_plugins():
+        if not (plugin.path / ".git").exists():
+            missing.append(plugin)
+        elif plugin.name in pins and checkout_head(plugin.path) != pins[plugin.name]:
+            moved.append(plugin)
+    if not missing and not moved:
+        return []
+
+    def sync() -> None:
+        results = sync_plugins(missing + moved, pins=pins)
+        failed = [name for name, result in results.items() if result.startswith("failed")]
+        if failed:
+            raise OSError(f"could not install {', '.join(failed)}")
+
+    actions = []
+    if missing:
+        actions.append(f"clone {', '.join(plugin.name for plugin in missing)}")
+    if moved:
+        actions.append(f"check out pinned {', '.join(plugin.name for plugin in moved)}")
+    return [Change(SYSTEM.script_dir / "vim" / "pack" / "minpac", "; ".join(actions), sync)]
+
+
+def report_plugins(results: Dict[str, str], summary: str) -> bool:
+    """
+    Show the per-plugin results of map_plugins().
+
+    Args:
+        results: Plugin name -> result
+        summary: Label of the count of plugins that did not fail
+
+    Returns:
+        True if no plugin failed
+    """
+    lines = [f"{name}: {result}" for name, result in sorted(results.items())]
+    failed = [name for name, result in results.items() if result.startswith("failed")]
+    lines.extend(["\x01 ", f"{len(results) - len(failed)} of {len(results)} plugin(s) {summary}"])
+    print()
+    box_draw(lines, title="PLUGINS")
+    print()
+    return not failed
+
+
+def sync_plugins_to_lock() -> bool:
+    """
+    Install missing vim plugins and check out the commits pinned in the lockfile.
+
+    Plugins without a pin are fetched to their latest commit.
+
+    Returns:
+        True if every plugin is installed at its pinned commit
+    """
+    print()
+    box_draw("Syncing Plugins")
+    print()
+    pins = load_plugin_lock()
+    plugins = vim_plugins()
+    pinned = [plugin for plugin in plugins if plugin.name in pins]
+    results = sync_plugins(pinned, pins=pins)
+    results.update(sync_plugins([plugin for plugin in plugins if plugin.name not in pins], update=True))
+    return report_plugins(results, "in sync")
+
+
+def update_plugins() -> bool:
+    """
+    Fetch the latest commit of every vim plugin and pin it in the lockfile.
+
+    A plugin that fails to update keeps its previous pin.
+
+    Returns:
+        True if every plugin was updated
+    """
+    print()
+    box_draw("Updating Plugins")
+    print()
+    results = sync_plugins(vim_plugins(), update=True)
+
+    pins = load_plugin_lock()
+    configured = {plugin.name: plugin for plugin in vim_plugins()}
+    pins = {name: commit for name, commit in pins.items() if name in configured}
+    for name, result in results.items():
+        commit = None if result.startswith("failed") else checkout_head(configured[name].path)
+        if commit:
+            pins[name] = commit
+    write_plugin_lock(pins)
+    print(f"Pinned {len(pins)} plugin(s) in {SETTINGS['plugin_lock']}")
+    return report_plugins(results, "updated")
+
+
+def refresh_mirrors() -> bool:
+    """
+    Create or refresh the mirror of every vim plugin in the mirror cache.
+
+    Returns:
+        True if every mirror is up to date
+    """
+    print()
+    box_draw("Refreshing Plugin Mirrors")
+    print(f"\nMirror cache: {mirror_dir()}\n")
+    return report_plugins(map_plugins(refresh_mirror, vim_plugins()), "mirrored")
+
+
+def export_plugin(plugin: VimPlugin, dest: Path) -> str:
+    """
+    Make a self-contained shallow copy of a plugin at its checked-out commit.
+
+    Unlike the plugin clone, the copy owns all of its objects (no mirror
+    alternates, no history beyond that commit), so it can be bundled.
+
+    Args:
+        plugin: Installed plugin
+        dest: Directory to create the copy in
+
+    Returns:
+        The commit of the copy
+
+    Raises:
+        OSError: If the plugin is not installed or git fails
+    """
+    commit = checkout_head(plugin.path)
+    if commit is None:
+        raise OSError("not installed, run --plugins-sync first")
+    run_git(["init", "--quiet", str(dest)])
+    run_git(["-C", str(dest), "fetch", "--quiet", "--depth=1", plugin.path.as_uri(), commit])
+    run_git(["-C", str(dest), "remote", "add", "origin", plugin.url])
+    run_git(["-C", str(dest), "checkout", "--quiet", "--detach", commit])
+    return commit
+
+
+def bundle_walk(root: Path, arcname: str, exclude: Iterable[str] = ()) -> Iterator[Tuple[str, Path]]:
+    """
+    Walk a tree for a bundle, yielding (archive name, path) in a stable order.
+    Symlinks are yielded, not followed.
+
+    Args:
+        root: Directory to walk
+        arcname: Archive name of `root`
+        exclude: Paths relative to `root` to leave out, with everything below them
+    """
+    excluded = set(exclude)
+    yield arcname, root
+    for dirpath, dirs, files in os.walk(root):
+        rel_dir = Path(dirpath).relative_to(root)
+        dirs[:] = sorted(d for d in dirs if (rel_dir / d).as_posix() not in excluded and d not in excluded)
+        for entry in dirs + sorted(f for f in files if (rel_dir / f).as_posix() not in excluded):
+            yield f"{arcname}/{(rel_dir / entry).as_posix()}", Path(dirpath) / entry
+
+
+def bundle_tracked(root: Path, arcname: str, exclude: Iterable[str] = ()) -> Optional[Iterator[Tuple[str, Path]]]:
+    """
+    List the files git tracks in a tree for a bundle, like bundle_walk():
+    (archive name, path) in a stable order, each file after its directories.
+    Untracked and ignored files are never listed.
+
+    Returns:
+        None if `root` is not in a git checkout (or git is missing)
+    """
+    try:
+        tracked = run_git(["-C", str(root), "ls-files", "-z"]).split("\0")
+    except OSError:
+        return None
+
+    excluded = set(exclude)
+
+    def walk() -> Iterator[Tuple[str, Path]]:
+        yield arcname, root
+        seen = set()
+        for rel in sorted(filter(None, tracked)):
+            parts = rel.split("/")
+            prefixes = ["/".join(parts[:i]) for i in range(1, len(parts) + 1)]
+            path = root / rel
+            if excluded.intersection(prefixes) or excluded.intersection(parts):
+                continue
+            if not (path.exists() or path.is_symlink()):
+                continue  # Deleted, not yet committed
+            for directory in prefixes[:-1]:
+                if directory not in seen:
+                    seen.add(directory)
+                    yield f"{arcname}/{directory}", root / directory
+            yield f"{arcname}/{rel}", path
+
+    return walk()
+
+
+def ignored_paths(root: Path, paths: List[str]) -> List[str]:
+    """
+    The paths (relative to `root`) that git's ignore rules match, tracked or
+    not. Empty if `root` is not in a git checkout.
+    """
+    import subprocess
+
+    try:
+        result = subprocess.run(
+            ["git", "-C", str(root), "check-ignore", "--no-index", "--stdin", "-z"],
+            input="\0".join(paths),
             capture_output=True,
+            text=True,
         )
-        print("minpac installed successfully")
-    except subprocess.CalledProcessError as e:
-        print(f"Warning: Failed to install minpac: {e}")
-        print("You can manually install it later with:")
-        print(f"  git clone --depth=1 https://github.com/k-takata/minpac.git {minpac_dir}")
+    except OSError:
+        return []
+    # Exit status 1: nothing ignored; 128: not a git checkout
+    return [path for path in result.stdout.split("\0") if path] if result.returncode == 0 else []
+
+
+def create_bundle(bundle: Optional[Path] = None) -> bool:
+    """
+    Write the dotfiles tree and all vim plugins into one compressed archive.
+
+    The archive is streamed through the compressor (see archive_writer()),
+    files are hashed as they are added, and a manifest of every file's
+    SHA-256 is appended as the last member (BUNDLE_MANIFEST) so
+    install_bundle() can check the archive while extracting it. Plugins are
+    stored as self-contained shallow clones at their checked-out commits.
+    Of the dotfiles tree only the files git tracks are bundled (the whole
+    tree if it is not a git checkout), never per-user files, backups or
+    the repository itself (BUNDLE_EXCLUDE). A bundle holding a path git
+    ignores is discarded.
+
+    Args:
+        bundle: Archive to create (default: dotfiles-bundle-{timestamp}.tar.zst
+                or .tar.xz in the current directory)
+
+    Returns:
+        True if the bundle was written
+    """
+    import datetime
+    import io
+    import json
+    import tarfile
+    import tempfile
+
+    timestamp = datetime.datetime.now()
+    if bundle is None:
+        bundle = Path(f"dotfiles-bundle-{timestamp.strftime('%Y%m%d_%H%M%S')}{archive_suffix()}")
+    bundle = bundle.expanduser().absolute()
+    if not bundle.name.endswith(tuple(suffix for suffix, _, _ in BACKUP_ARCHIVERS)):
+        print(f"\nError: bundle name must end in {' or '.join(suffix for suffix, _, _ in BACKUP_ARCHIVERS)}\n")
+        return False
+
+    print()
+    box_draw("Creating Bundle")
+    print(f"\nBundle: {bundle}\n")
+
+    with tempfile.TemporaryDirectory(prefix="dotsetup-bundle-") as tmp:
+        exports = Path(tmp)
+        results = map_plugins(lambda plugin: export_plugin(plugin, exports / plugin.kind / plugin.name), vim_plugins())
+        failed = [name for name, result in results.items() if result.startswith("failed")]
+        if failed:
+            print(f"\nError: could not bundle {', '.join(failed)}\n")
+            return False
+
+        exclude = list(BUNDLE_EXCLUDE)
+        if SYSTEM.script_dir.resolve() in bundle.parents:
+            exclude.append(bundle.relative_to(SYSTEM.script_dir.resolve()).as_posix())
+        tree = bundle_tracked(SYSTEM.script_dir, "dotfiles", exclude)
+        sources = [tree if tree is not None else bundle_walk(SYSTEM.script_dir, "dotfiles", exclude)]
+        sources.extend(
+            bundle_walk(exports / kind, f"dotfiles/vim/pack/minpac/{kind}") for kind in ("start", "opt")
+            if (exports / kind).is_dir()
+        )
+
+        files: Dict[str, str] = {}
+        tmp_bundle = bundle.with_name(f".{bundle.name}.tmp{os.getpid()}")
+        try:
+            # Bundles hold only the public dotfiles tree: keep umask permissions
+            with archive_writer(tmp_bundle, 0o666) as tar:
+                seen_dirs = set()
+                members: List[str] = []
+                for source in sources:
+                    for arcname, path in source:
+                        if arcname != "dotfiles":
+                            members.append(arcname)
+                        info = tar.gettarinfo(str(path), arcname)
+                        info.uid = info.gid = 0
+                        info.uname = info.gname = ""
+                        if info.isdir():
+                            # The plugin kind directories are already in the tree walk
+                            if arcname not in seen_dirs:
+                                seen_dirs.add(arcname)
+                                tar.addfile(info)
+                        elif info.isfile() or info.islnk():
+                            # Hardlinked files are stored as plain copies
+                            info.type = tarfile.REGTYPE
+                            info.linkname = ""
+                            info.size = path.lstat().st_size
+                            with open(path, "rb") as f:
+                                reader = HashingReader(f)
+                                tar.addfile(info, reader)
+                            files[arcname] = reader.digest.hexdigest()
+                        elif info.issym():
+                            tar.addfile(info)
+
+                manifest = {
+                    "format": 1,
+                    "created": timestamp.isoformat(timespec="seconds"),
+                    "version": SETTINGS["version"],
+                    "plugins": {name: commit for name, commit in sorted(results.items())},
+                    "files": files,
+                }
+                data = json.dumps(manifest, indent=1, sort_keys=True).encode()
+                info = tarfile.TarInfo(BUNDLE_MANIFEST)
+                info.size = len(data)
+                info.mtime = int(timestamp.timestamp())
+                tar.addfile(info, io.BytesIO(data))
+
+            # Last line of defence against shipping one user's files (undo
+            # history, credentials) to other machines
+            ignored = ignored_paths(
+                SYSTEM.script_dir,
+                [name[len("dotfiles/") :] for name in members if not name.startswith("dotfiles/vim/pack/")],
+            )
+            if ignored:
+                print(f"\nError: the bundle would contain ignored paths: {', '.join(ignored[:5])}\n")
+                return False
+            os.replace(tmp_bundle, bundle)
+        finally:
+            if tmp_bundle.exists():
+                tmp_bundle.unlink()
+
+    size = bundle.stat().st_size
+    print(f"\nBundle complete! {len(files)} file(s), {len(results)} plugin(s), {size / 1048576:.1f} MiB")
+    print(f"Install it with: python3 DotSetup.py --bundle-install {bundle}\n")
+    return True
+
+
+def install_bundle(bundle: Path, dest: Optional[Path] = None) -> bool:
+    """
+    Provision from a bundle made by create_bundle(), without network access.
+
+    The bundle is streamed once into a staging directory next to `dest`,
+    hashing every file; only if all files match the bundle's manifest is the
+    staged tree moved to `dest`. The install is then run from it with
+    --skip-user, finding every plugin already at its pinned commit.
+
+    Args:
+        bundle: Bundle archive
+        dest: Where to put the dotfiles tree (default SETTINGS["dotfiles"]);
+              must not exist or be an empty directory
+
+    Returns:
+        True if the bundle was extracted and installed
+    """
+    import json
+    import shutil
+    import subprocess
+    import tarfile
+
+    dest = Path(dest or SETTINGS["dotfiles"]).expanduser().absolute()
+    if dest.is_symlink() or (dest.exists() and (not dest.is_dir() or any(dest.iterdir()))):
+        print(f"\nError: {dest} already exists, remove it or pick another destination\n")
+        return False
+
+    print()
+    box_draw("Installing Bundle")
+    print(f"\nBundle: {bundle}\nDestination: {dest}\n")
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    staging = dest.parent / f".{dest.name}.bundle-{os.getpid()}"
+    staging.mkdir()
+    root = staging.resolve()
+    try:
+        manifest = None
+        digests: Dict[str, str] = {}
+        with archive_reader(bundle) as tar:
+            for member in tar:
+                if member.name == BUNDLE_MANIFEST:
+                    reader = tar.extractfile(member)
+                    manifest = json.load(reader) if reader else None
+                    continue
+                parts = Path(member.name).parts
+                if not parts or parts[0] != "dotfiles" or ".." in parts or Path(member.name).is_absolute():
+                    raise OSError(f"unexpected member {member.name}")
+                target = staging / member.name
+                # Never write through a symlink extracted earlier
+                parent = target.parent.resolve()
+                if parent != root and root not in parent.parents:
+                    raise OSError(f"member {member.name} escapes the bundle")
+                if member.isdir():
+                    target.mkdir(parents=True, exist_ok=True)
+                    target.chmod(member.mode | 0o700)
+                elif member.issym():
+                    os.symlink(member.linkname, target)
+                elif member.isfile():
+                    reader = tar.extractfile(member)
+                    if reader is None:
+                        raise OSError(f"cannot read member {member.name}")
+                    reader = HashingReader(reader)
+                    with open(target, "wb") as f:
+                        shutil.copyfileobj(reader, f, 1 << 20)
+                    target.chmod(member.mode)
+                    os.utime(target, (member.mtime, member.mtime))
+                    digests[member.name] = reader.digest.hexdigest()
+
+        if manifest is None:
+            raise OSError("bundle has no manifest (truncated?)")
+        names = set(manifest["files"]) | set(digests)
+        bad = sorted(name for name in names if manifest["files"].get(name) != digests.get(name))
+        if bad:
+            raise OSError(f"{len(bad)} file(s) missing or corrupt, e.g. {bad[0]}")
+        os.replace(staging / "dotfiles", dest)
+    except (OSError, ValueError, EOFError, tarfile.TarError) as e:
+        print(f"\nError: bundle is not usable, nothing was installed: {e}\n")
+        return False
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    print(f"Extracted {len(digests)} file(s) and {len(manifest['plugins'])} plugin(s), all verified\n")
+    return subprocess.run([sys.executable, str(dest / SYSTEM.script_file), "--skip-user"], cwd=dest).returncode == 0
+
+
+def plan_sys_links() -> List[Change]:
+    """
+    Create symlinks from dotfiles to standard home directory locations.
+
+    Creates a symlink for every "link" entry of the managed-entry manifest
+    (see managed_entries()), e.g. {DOT_FILES}/vim -> ~/.vim. Whatever is at
+    a destination that is not already the right link is replaced.
+
+    ~/.gitconfig is skipped: plan_link_user_git() owns it, linking it only
+    if it doesn't exist and otherwise editing the user's file in place.
+    """
+    gitconfig = SYSTEM.home / ".gitconfig"
+    changes = []
+    for entry in managed_entries():
+        if entry.kind == "link" and entry.source is not None and entry.dest != gitconfig:
+            changes.extend(link_change(entry.source, entry.dest))
+    return changes
+
+
+def plan_export_dot_files() -> List[Change]:
+    """
+    Export DOT_FILES environment variable to shell configuration files.
+
+    Appends to ~/.bashrc, ~/.bash_profile, and/or ~/.zshrc depending on OS.
+    Adds three lines:
+    - export DOT_FILES={script_dir}
+    - export CLICOLOR=1
+    - source $DOT_FILES/shell/autorun.sh
+
+    Safely handles existing lines to avoid duplicates, and updates
+    DOT_FILES path if it has changed.
+    """
+
+    def export_change(file_path: Path, export_lines: List[str]) -> List[Change]:
+        try:
+            with open(file_path) as f:
+                existing_lines = f.readlines()
+        except FileNotFoundError:
+            existing_lines = []
+
+        # A DOT_FILES line pointing elsewhere is dropped, the new one is appended
+        dotfiles_line = export_lines[0]  # export DOT_FILES=...
+        if dotfiles_line not in existing_lines:
+            existing_lines = [line for line in existing_lines if not line.startswith("export DOT_FILES=")]
+        content = "".join(existing_lines)
+        if content and not content.endswith("\n"):
+            content += "\n"
+        return file_change(file_path, content + "".join(line for line in export_lines if line not in existing_lines))
+
+    exportLines = [
+        f"export DOT_FILES={str(SYSTEM.script_dir)}\n",
+        "export CLICOLOR=1\n",
+        "source $DOT_FILES/shell/autorun.sh\n",
+    ]
+
+    if SYSTEM.os_kind == "Darwin":
+        # ~/.bash_profile, and ~/.zshrc with zsh-specific prompt
+        return [
+            *export_change(SYSTEM.home / ".bash_profile", exportLines),
+            *export_change(SYSTEM.home / ".zshrc", [*exportLines, "prompt='%F{028}%n@%m %F{025}%~%f %% '\n"]),
+        ]
+
+    # Linux and other systems: support both bash and zsh
+    changes = []
+
+    # ~/.bashrc for bash (if it exists)
+    bashrc_path = SYSTEM.home / ".bashrc"
+    if bashrc_path.is_file():
+        changes.extend(export_change(bashrc_path, exportLines))
+
+    # ~/.zshrc for zsh (if it exists or user uses zsh)
+    zshrc_path = SYSTEM.home / ".zshrc"
+    if zshrc_path.is_file() or zshrc_path.is_symlink() or os.environ.get("SHELL", "").endswith("zsh"):
+        changes.extend(export_change(zshrc_path, exportLines))
+    return changes
+
+
+def shell_init_path() -> Path:
+    """
+    Location of the shell init snapshot sourced by shell/autorun.sh.
+    """
+    return get_cache_dir() / "shell-init.sh"
+
+
+def shell_init_inputs() -> Tuple[List[Path], List[str]]:
+    """
+    What the shell init snapshot values depend on.
+
+    Only things whose change alters a value are tracked: the scripts and
+    config files read, the git-prompt script picked and each binary the
+    snapshot probes. Binaries that are not installed are returned by name,
+    autorun.sh looks them up with the `command -v` builtin to notice an install.
+
+    Returns:
+        Tuple of (existing input files, names of the probed commands that are not installed)
+    """
+    import shutil
+
+    inputs = [
+        SYSTEM.script_dir / SYSTEM.script_file,
+        SYSTEM.script_dir / "scripts" / "detectOS.sh",
+        Path("/etc/os-release"),
+    ]
+    git_prompt = next((p for p in SHELL_GIT_PROMPTS if Path(p).is_file()), None)
+    if git_prompt:
+        inputs.append(Path(git_prompt))
+    missing = []
+    for command in ("brew", "flutter"):
+        binary = shutil.which(command)
+        if binary:
+            # Not resolved: `-nt` follows the link to the binary, `-e` notices it moving
+            inputs.append(Path(binary))
+        else:
+            missing.append(command)
+    return [path for path in dict.fromkeys(inputs) if path.exists()], missing
+
+
+def shell_init_checks(inputs: List[Path], missing: List[str]) -> List[str]:
+    """
+    Shell lines that clear DOTSETUP_INIT_LOADED when the snapshot is stale:
+    an input is gone or newer than it, or a missing command got installed.
+    """
+    import shlex
+
+    return [
+        f"for _dotsetup_input in {' '.join(shlex.quote(str(path)) for path in inputs)}; do",
+        "    if [[ ! -e $_dotsetup_input || $_dotsetup_input -nt $DOTSETUP_INIT ]]; then",
+        "        DOTSETUP_INIT_LOADED=0",
+        "        break",
+        "    fi",
+        "done",
+        f"for _dotsetup_input in {' '.join(missing)}; do",
+        '    if command -v "$_dotsetup_input" &>/dev/null; then',
+        "        DOTSETUP_INIT_LOADED=0",
+        "        break",
+        "    fi",
+        "done",
+        "unset _dotsetup_input",
+    ]
+
+
+def shell_init_stale() -> bool:
+    """
+    Whether the shell init snapshot is missing, older than any of its inputs
+    or was built from a different set of inputs.
+    """
+    target = shell_init_path()
+    try:
+        built = target.stat().st_mtime_ns
+        text = target.read_text()
+    except (OSError, UnicodeDecodeError):
+        return True
+    inputs, missing = shell_init_inputs()
+    if "\n".join(shell_init_checks(inputs, missing)) not in text:
+        return True
+    return any(path.stat().st_mtime_ns > built for path in inputs)
+
+
+def write_shell_init() -> Path:
+    """
+    Resolve the machine-specific values shell/autorun.sh needs and write them
+    to a snapshot it sources instead of detecting them on every shell start.
+
+    The snapshot holds the OS (as scripts/detectOS.sh names it), `brew --prefix`,
+    the git-prompt script and the path of the cached `flutter bash-completion`
+    output. It checks its own inputs (see shell_init_inputs()) when sourced; if
+    one is gone or newer, or a probed command that was missing is installed,
+    autorun.sh ignores it and runs --shell-init in the background.
+
+    Returns:
+        The snapshot path
+    """
+    import datetime
+    import shlex
+    import shutil
+    import subprocess
+
+    cache = get_cache_dir()
+    cache.mkdir(parents=True, exist_ok=True)
+    target = shell_init_path()
+    # Inputs are listed before the values are resolved, so a change while
+    # resolving them leaves the snapshot stale rather than wrong
+    inputs, missing = shell_init_inputs()
+
+    # Same names as scripts/detectOS.sh derives from $OSTYPE
+    os_name = ""
+    os_kind = next(
+        (kind for prefix, kind in SHELL_OS_KINDS if sys.platform.startswith(prefix)), f"unknown: {sys.platform}"
+    )
+    if os_kind == "LINUX":
+        release: Dict[str, str] = {}
+        try:
+            with open("/etc/os-release") as f:
+                for line in f:
+                    key, _, value = line.strip().partition("=")
+                    if key and value:
+                        release[key] = (shlex.split(value) or [""])[0]
+        except OSError:
+            pass
+        os_name = release.get("PRETTY_NAME") or " ".join(
+            v for v in (release.get("ID"), release.get("VERSION") or release.get("VERSION_ID")) if v
+        )
+
+    brew_prefix = ""
+    if shutil.which("brew"):
+        try:
+            brew_prefix = subprocess.run(
+                ["brew", "--prefix"], capture_output=True, text=True, timeout=SETTINGS["probe_timeout"]
+            ).stdout.strip()
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+    git_prompt = next((p for p in SHELL_GIT_PROMPTS if Path(p).is_file()), "")
+
+    flutter_completion = ""
+    if shutil.which("flutter"):
+        completion = cache / "flutter-completion.bash"
+        try:
+            # flutter may update itself on first use, give it time
+            result = subprocess.run(
+                ["flutter", "bash-completion"], capture_output=True, text=True, timeout=SETTINGS["probe_timeout"] * 12
+            )
+            if result.returncode == 0 and result.stdout:
+                completion.write_text(result.stdout)
+                flutter_completion = str(completion)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+
+    values = {
+        "DOTSETUP_OS": os_kind,
+        "DOTSETUP_OS_NAME": os_name,
+        "DOTSETUP_BREW_PREFIX": brew_prefix,
+        "DOTSETUP_GIT_PROMPT": git_prompt,
+        "DOTSETUP_FLUTTER_COMPLETION": flutter_completion,
+    }
+    lines = [
+        f"# Generated by DotSetup.py --shell-init on {datetime.datetime.now():%Y-%m-%d %H:%M:%S}, do not edit.",
+        "# Sourced by shell/autorun.sh with DOTSETUP_INIT set to this file; the values",
+        "# are only used while its inputs are unchanged.",
+        "DOTSETUP_INIT_LOADED=1",
+        *shell_init_checks(inputs, missing),
+        "if [[ $DOTSETUP_INIT_LOADED == 1 ]]; then",
+        *(f"    {name}={shlex.quote(value)}" for name, value in values.items()),
+        "fi",
+    ]
+
+    tmp_path = target.with_name(f".{target.name}.tmp{os.getpid()}")
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, target)
+    return target
+
+
+def plan_shell_init() -> List[Change]:
+    """
+    Build the shell init snapshot if it is missing or stale.
+    """
+    if not shell_init_stale():
+        return []
+    return [Change(shell_init_path(), "build shell init snapshot", write_shell_init)]
+
+
+class InstallStep(NamedTuple):
+    """
+    One install step: its planner and the steps that have to finish first.
+    """
+
+    name: str
+    plan: Callable[[], List[Change]]
+    after: Tuple[str, ...] = ()
+
+
+def install_steps(user: Optional[UserData]) -> List[InstallStep]:
+    """
+    The install workflow, in dependency order.
+
+    Steps that touch disjoint files have no dependency and are run
+    concurrently by install(), e.g. the plugin clones and the shell exports.
+    """
+    return [
+        InstallStep("dotfiles", plan_dotfiles_symlink),
+        # vim/user.vim and git/gitconfig are written through ~/dotfiles
+        InstallStep("user.vim", lambda: plan_user_vim(user), ("dotfiles",)),
+        InstallStep("gitconfig", lambda: plan_user_git(user), ("dotfiles",)),
+        InstallStep("~/.gitconfig", lambda: plan_link_user_git(user), ("gitconfig",)),
+        InstallStep("folders", plan_folders),
+        # ~/.ssh is created by the folders step
+        InstallStep("ssh", plan_ssh_multiplexing, ("folders",)),
+        InstallStep("plugins", plan_plugins),
+        # Links into the dotfiles; ~/.gitconfig is left to its own step
+        InstallStep("links", plan_sys_links, ("dotfiles",)),
+        InstallStep("shell", plan_export_dot_files),
+        InstallStep("shell-init", plan_shell_init),
+    ]
+
+
+def run_graph(tasks: Dict[str, Tuple[Callable[[], None], Tuple[str, ...]]], jobs: int) -> Dict[str, str]:
+    """
+    Run tasks as soon as their dependencies have finished, up to `jobs` at a time.
+
+    A task that raises only blocks the tasks that depend on it (directly or
+    not); independent tasks still run.
+
+    Args:
+        tasks: Task name -> (function, names of the tasks it depends on)
+        jobs: Maximum number of tasks running at once
+
+    Returns:
+        Task name -> "done", "failed: {error}" or "blocked by {task}"
+
+    Raises:
+        ValueError: If a dependency is unknown or the dependencies form a cycle
+    """
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    for name, (_, after) in tasks.items():
+        for dep in after:
+            if dep not in tasks:
+                raise ValueError(f"Step '{name}' depends on unknown step '{dep}'")
+
+    status: Dict[str, str] = {}
+    running: Dict[Any, str] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while len(status) < len(tasks):
+            progress = True
+            while progress:
+                # Blocking one task may block the tasks after it, so repeat until settled
+                progress = False
+                for name, (run, after) in tasks.items():
+                    if name in status or name in running.values():
+                        continue
+                    failed = [dep for dep in after if status.get(dep, "done") != "done"]
+                    if failed:
+                        status[name] = f"blocked by {failed[0]}"
+                        progress = True
+                    elif all(dep in status for dep in after):
+                        running[pool.submit(run)] = name
+
+            if not running:
+                if len(status) < len(tasks):
+                    raise ValueError(f"Dependency cycle among steps: {', '.join(sorted(set(tasks) - set(status)))}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    status[name] = "done"
+                except Exception as e:
+                    sys.stdout.write(f" {name}: failed: {e}\n")
+                    status[name] = f"failed: {e}"
+    return status
+
+
+def managed_ids(path: Path) -> List[str]:
+    """
+    Snapshot keys of the managed entries a change to `path` modifies
+    (the path itself, or the file it links to).
+    """
+    paths = {path, path.resolve()}
+    return [entry.id for entry in managed_entries() if entry.backup and entry.dest in paths]
+
+
+def display_plan(plan: List[Tuple[str, Change]]) -> None:
+    """
+    Show the changes an install would make.
+    """
+    lines = [f"{step}: {change.action}: {change.target}" for step, change in plan]
+    if not lines:
+        lines = ["Nothing to do, everything is up to date"]
+    lines.extend(["\x01 ", f"{len(plan)} change(s)"])
+
+    print()
+    box_draw(lines, title="PLAN")
+    print()
+
+
+@lru_cache(maxsize=None)
+def managed_entries() -> Tuple[ManagedEntry, ...]:
+    """
+    Load the managed-entry manifest (SETTINGS["managed"]) and compile it for
+    this host. The result is cached, linking, backup and restore all use
+    the same plan.
+
+    The manifest is {"entries": [...]}, one JSON object per managed path:
+        dest      Where the entry lives; "~/" is the home directory, a
+                  relative path is inside the dotfiles tree
+        source    What dest links to, relative to the dotfiles tree ("link" only)
+        kind      "link" (plan_sys_links() links dest to source) or
+                  "file" (managed in place, e.g. generated or appended to)
+        backup    false to leave it out of backups and restores (default true)
+        platforms platform.system() names it applies to, e.g. ["Darwin"] (default all)
+        id        Snapshot key (default the file name of dest)
+
+    Raises:
+        ValueError: On an invalid entry, or two entries with the same id
+    """
+    import json
+
+    manifest = SYSTEM.script_dir / SETTINGS["managed"]
+    with open(manifest, encoding="utf-8") as f:
+        items = json.load(f)["entries"]
+
+    def expand(value: str) -> Path:
+        if value == "~" or value.startswith("~/"):
+            return SYSTEM.home / value[2:]
+        return SYSTEM.script_dir / value
+
+    entries: List[ManagedEntry] = []
+    seen: Dict[str, str] = {}
+    for item in items:
+        kind = item.get("kind", "link")
+        if "dest" not in item or kind not in ("link", "file") or (kind == "link" and "source" not in item):
+            raise ValueError(f"{manifest}: invalid entry {item}")
+        platforms = item.get("platforms")
+        if platforms is not None and SYSTEM.os_kind not in platforms:
+            continue
+
+        dest = expand(item["dest"])
+        entry_id = item.get("id", dest.name)
+        if "/" in entry_id or not entry_id:
+            raise ValueError(f"{manifest}: invalid id {entry_id!r} for {item['dest']}")
+        if entry_id in seen:
+            raise ValueError(
+                f"{manifest}: {item['dest']} and {seen[entry_id]} share the snapshot key {entry_id!r}, give one an 'id'"
+            )
+        seen[entry_id] = item["dest"]
+        source = expand(item["source"]) if "source" in item else None
+        entries.append(ManagedEntry(entry_id, source, dest, kind, item.get("backup", True)))
+    return tuple(entries)
+
+
+def backup_targets() -> Dict[str, Path]:
+    """
+    Files and directories backed up by backup_all() and put back by
+    restore(): snapshot key -> location, from managed_entries().
+    """
+    return {entry.id: entry.dest for entry in managed_entries() if entry.backup}
+
+
+def backup_all(keys: Optional[Iterable[str]] = None, names: Optional[Iterable[str]] = None) -> bool:
+    """
+    Create a backup of all dotfiles and system configurations without making any changes
+
+    Args:
+        keys: Only back up these snapshot keys (a partial snapshot, used by
+              restore() to save just the entries it is about to change)
+        names: Only back up these targets, in full (a partial snapshot, used by
+               install() to save just the targets it is about to change)
+
+    Returns:
+        True if the snapshot was saved, False if it had to be abandoned (an
+        archive snapshot whose stream broke, see ArchiveAborted)
+    """
+    import datetime
+    import shutil
+
+    # Create timestamped backup directory
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    backup_base = Path(SETTINGS["backup_path"]).expanduser()
+
+    # Unchanged files are deduplicated against the most recent snapshot,
+    # chosen before the new (still empty) snapshot directory exists
+    backups = [d for d in list_backups() if d.is_dir()]
+    previous = load_manifest(backups[-1]) if backups else None
+
+    backup_dir = backup_base / timestamp
+    suffix = 1
+    while backup_dir.exists():
+        # Two backups within one second (e.g. restore right after install)
+        suffix += 1
+        backup_dir = backup_base / f"{timestamp}_{suffix}"
+    backup_dir.mkdir(parents=True)
+    layout = {"store": "objects", "archive": "archive"}.get(SETTINGS["backup_mode"], "tree")
+    manifest = new_manifest(backup_dir.name, layout)
+    if keys is not None:
+        keys = set(keys)
+        manifest["partial"] = True
+    if names is not None:
+        names = set(names)
+        manifest["partial"] = True
+
+    print()
+    box_draw("Creating Backup")
+    print(f"\nBackup directory: {backup_dir}\n")
+
+    sources = [
+        (name, fp)
+        for name, fp in backup_targets().items()
+        if (names is None or name in names) and (fp.exists() or fp.is_symlink())
+    ]
+
+    try:
+        with ExitStack() as stack:
+            archive = None
+            pool = None
+            if layout == "archive":
+                # One tar stream, written in walk order from this thread
+                manifest["archive"] = f"snapshot{archive_suffix()}"
+                archive = stack.enter_context(archive_writer(backup_dir / manifest["archive"]))
+            elif SETTINGS["jobs"] > 1 and sources:
+                from concurrent.futures import ThreadPoolExecutor
+
+                # Targets are walked concurrently and all of their files share one worker pool
+                pool = stack.enter_context(ThreadPoolExecutor(max_workers=SETTINGS["jobs"]))
+                walkers = stack.enter_context(ThreadPoolExecutor(max_workers=len(sources)))
+
+            def backup_source(source: Tuple[str, Path]) -> Tuple[bool, Dict[str, Any]]:
+                # Each target fills its own part of the manifest, so concurrent
+                # walkers never share a dict; the parts are merged below
+                part = dict(manifest, roots={}, files={})
+                return backup_file(source[1], backup_dir, part, previous, archive, keys, pool, source[0]), part
+
+            if pool is None:
+                results: Iterable[Tuple[bool, Dict[str, Any]]] = [backup_source(source) for source in sources]
+            else:
+                results = walkers.map(backup_source, sources)
+            backed_up_count = 0
+            for backed_up, part in results:
+                # Merged in target order, each target's entries in walk order
+                manifest["roots"].update(part["roots"])
+                manifest["files"].update(part["files"])
+                backed_up_count += backed_up
+    except ArchiveAborted as e:
+        shutil.rmtree(backup_dir, ignore_errors=True)
+        print(f" Error: {e}")
+        print(f"\nBackup failed, the archive was left incomplete and has been removed: {backup_dir}\n")
+        return False
+
+    if layout == "archive":
+        manifest["archive_stat"] = stored_stat(backup_dir / manifest["archive"])
+    save_manifest(backup_dir, manifest)
+    append_catalog(catalog_record(manifest))
+
+    print(f"\nBackup complete! {backed_up_count} file(s)/directory(ies) backed up.")
+    print(f"Backup location: {backup_dir}\n")
+
+    if SETTINGS["backup_prune_after_backup"]:
+        prune_backups()
+    return True
+
+
+def new_manifest(timestamp: str, layout: str) -> Dict[str, Any]:
+    """
+    Create an empty snapshot manifest.
+
+    Layout "objects" keeps file contents in the shared object store,
+    "tree" keeps a plain copy of every file inside the snapshot directory,
+    "archive" keeps them in one compressed tar (manifest["archive"]).
+    Manifest "files" keys are POSIX paths relative to the snapshot root;
+    "roots" maps each top-level key to the location it was backed up from.
+    A "partial" manifest holds only some entries below its roots; restoring
+    it leaves everything else in place. File records carry the SHA-256
+    "digest" of their contents and the "stored" stat tuple of the copy in
+    the backup (see stored_stat(); "archive_stat" for an archive).
+    """
+    return {"format": 1, "timestamp": timestamp, "layout": layout, "roots": {}, "files": {}}
+
+
+def save_manifest(backup_dir: Path, manifest: Dict[str, Any]) -> None:
+    """
+    Atomically write a snapshot manifest.
+    """
+    import json
+
+    tmp_path = backup_dir / f"{BACKUP_MANIFEST}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, backup_dir / BACKUP_MANIFEST)
+
+
+def load_manifest(backup_dir: Path) -> Dict[str, Any]:
+    """
+    Load a snapshot manifest.
+
+    Snapshots made before manifests existed are plain copies; their manifest
+    is synthesized by walking the directory (without digests).
+    """
+    import json
+
+    try:
+        with open(backup_dir / BACKUP_MANIFEST, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+
+    manifest = new_manifest(backup_dir.name, "tree")
+    for top in sorted(backup_dir.iterdir()):
+        manifest["roots"][top.name] = None
+        for key, path, st in walk_target(top, top.name):
+            record = stat_record(path, st)
+            if record is not None:
+                manifest["files"][key] = record
+    return manifest
+
+
+def stat_record(path: Path, st: os.stat_result) -> Optional[Dict[str, Any]]:
+    """
+    Manifest record for a path from its lstat(), without reading it (file
+    records have no digest). Returns None for sockets, FIFOs and devices.
+    """
+    import stat
+
+    if stat.S_ISLNK(st.st_mode):
+        return {"type": "link", "target": os.readlink(path)}
+    if stat.S_ISDIR(st.st_mode):
+        return {"type": "dir", "mode": stat.S_IMODE(st.st_mode)}
+    if stat.S_ISREG(st.st_mode):
+        return {"type": "file", "size": st.st_size, "mtime": st.st_mtime_ns, "mode": stat.S_IMODE(st.st_mode)}
+    return None
+
+
+def live_manifest() -> Dict[str, Any]:
+    """
+    Describe the current state of the backup targets as a manifest.
+
+    Nothing is read: file records have no digest but carry their "path",
+    so diff_manifests() can hash them if it has to.
+    """
+    manifest = new_manifest("live", "live")
+    for name, source in backup_targets().items():
+        if not (source.exists() or source.is_symlink()):
+            continue
+        manifest["roots"][name] = str(source)
+        for key, path, st in walk_target(source, name):
+            record = stat_record(path, st)
+            if record is not None:
+                if record["type"] == "file":
+                    record["path"] = str(path)
+                manifest["files"][key] = record
+    return manifest
+
+
+def write_entries(backup_dir: Path, manifest: Dict[str, Any], paths: Dict[str, Path]) -> None:
+    """
+    Write snapshot entries to the given paths.
+
+    File contents are copied by SETTINGS["jobs"] worker threads. An archive
+    is instead read in one pass (see read_snapshot_files()), so it is
+    streamed at most once.
+
+    Args:
+        backup_dir: Snapshot directory
+        manifest: Snapshot manifest
+        paths: Snapshot key -> path to write it to. A key's parent
+               directory must exist or be written by an earlier key.
+
+    Raises:
+        OSError: If any entry could not be written (each failed file is
+                 reported), or would land outside the outermost entry it
+                 is written below (e.g. through a symlink written earlier)
+    """
+    files = manifest["files"]
+    wanted: Dict[str, Path] = {}  # File key -> path
+    dirs: List[Tuple[Path, int]] = []
+
+    for key in sorted(paths):
+        record = files[key]
+        target = paths[key]
+        parts = key.split("/")
+        outer = next((a for a in ("/".join(parts[:i]) for i in range(1, len(parts))) if a in paths), None)
+        if outer is not None:
+            root = paths[outer].parent.resolve() / paths[outer].name
+            parent = target.parent.resolve()
+            if parent != root and root not in parent.parents:
+                raise OSError(f"refusing to write {key} outside {paths[outer]} (to {parent})")
+        if record["type"] == "dir":
+            target.mkdir()
+            dirs.append((target, record["mode"]))
+        elif record["type"] == "link":
+            target.symlink_to(record["target"])
+        else:
+            wanted[key] = target
+
+    def write_file(key: str, reader: BinaryIO) -> None:
+        target = wanted[key]
+        with open(target, "wb") as f:
+            for chunk in iter(lambda: reader.read(1 << 20), b""):
+                f.write(chunk)
+        target.chmod(files[key]["mode"])
+        os.utime(target, ns=(files[key]["mtime"], files[key]["mtime"]))
+
+    def copy_file(key: str) -> None:
+        with open(snapshot_file_path(backup_dir, manifest, key), "rb") as reader:
+            write_file(key, reader)
+
+    failures: Dict[str, str] = {}
+    if manifest["layout"] != "archive" and SETTINGS["jobs"] > 1 and len(wanted) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=SETTINGS["jobs"]) as pool:
+            futures = {key: pool.submit(copy_file, key) for key in wanted}
+        for key, future in futures.items():
+            if future.exception() is not None:
+                failures[key] = str(future.exception())
+    else:
+        pending = set(wanted)
+        for key, reader in read_snapshot_files(backup_dir, manifest, wanted):
+            pending.discard(key)
+            try:
+                write_file(key, reader)
+            except OSError as e:
+                failures[key] = str(e)
+        for key in pending:
+            failures[key] = "missing from snapshot"
+
+    if failures:
+        for key in sorted(failures):
+            print(f" Warning: Failed to restore {key}: {failures[key]}")
+        raise OSError(f"{len(failures)} file(s) could not be restored")
+
+    # Directory modes last, a read-only directory would block its files
+    for target, mode in reversed(dirs):
+        target.chmod(mode)
+
+
+def plan_restore(manifest: Dict[str, Any], name: str, dest: Path) -> Tuple[Dict[str, str], Set[str]]:
+    """
+    Compare the current state of a restore destination with a snapshot.
+
+    A file whose size and mtime match its record is taken as unchanged
+    without being read; only a file of the same size but a different mtime
+    is hashed against the recorded digest.
+
+    Args:
+        manifest: Snapshot manifest
+        name: Top-level snapshot key
+        dest: Where that key is restored to
+
+    Returns:
+        (plan, existing): key -> action for every entry that differs:
+        "write" (recreate from the snapshot), "meta" (same contents, fix
+        mode and mtime) or "remove" (not in the snapshot; never for partial
+        snapshots); and the planned keys that exist now, found by an lstat
+        walk that never follows symlinks
+    """
+    import stat
+
+    files = manifest["files"]
+    current: Dict[str, Tuple[Path, os.stat_result]] = {}
+    if dest.exists() or dest.is_symlink():
+        current = {key: (path, st) for key, path, st in walk_target(dest, name)}
+
+    plan: Dict[str, str] = {}
+    for key in (k for k in files if k == name or k.startswith(f"{name}/")):
+        record = files[key]
+        # Nothing lives below a link or a file; such records (from older
+        # snapshots that followed a symlink) would be written through it
+        parts = key.split("/")
+        if any(files.get("/".join(parts[:i]), {}).get("type") in ("link", "file") for i in range(1, len(parts))):
+            continue
+        if key not in current:
+            plan[key] = "write"
+            continue
+        path, st = current[key]
+        mode = stat.S_IMODE(st.st_mode)
+        if record["type"] == "link":
+            if not stat.S_ISLNK(st.st_mode) or os.readlink(path) != record["target"]:
+                plan[key] = "write"
+        elif record["type"] == "dir":
+            if not stat.S_ISDIR(st.st_mode):
+                plan[key] = "write"
+            elif mode != record["mode"]:
+                plan[key] = "meta"
+        elif not stat.S_ISREG(st.st_mode) or st.st_size != record["size"]:
+            plan[key] = "write"
+        elif st.st_mtime_ns != record["mtime"]:
+            same = bool(record.get("digest")) and file_digest(path) == record["digest"]
+            plan[key] = "meta" if same else "write"
+        elif mode != record["mode"]:
+            plan[key] = "meta"
+
+    if not manifest.get("partial"):
+        for key in current:
+            if key not in files:
+                plan[key] = "remove"
+    return plan, {key for key in plan if key in current}
+
+
+def apply_restore_plan(
+    backup_dir: Path, manifest: Dict[str, Any], targets: Dict[str, Path], plans: Dict[str, Dict[str, str]]
+) -> None:
+    """
+    Carry out plan_restore() results as one all-or-nothing transaction.
+
+    Every entry to write is first staged next to its destination (new
+    directories are staged whole, with their contents inside). Only once
+    everything is staged are the entries swapped in with os.replace(),
+    each moving what it replaces aside. If any step fails, or the run is
+    interrupted, the swapped entries are put back and the staged copies
+    removed, leaving every destination as it was.
+
+    Args:
+        backup_dir: Snapshot directory
+        manifest: Snapshot manifest
+        targets: Top-level snapshot key -> destination path
+        plans: Top-level snapshot key -> plan_restore() plan
+
+    Raises:
+        OSError: If staging or swapping failed (after rolling back)
+    """
+    import shutil
+
+    def discard(path: Path) -> None:
+        if path.is_symlink() or path.is_file():
+            path.unlink()
+        elif path.is_dir():
+            shutil.rmtree(path)
+
+    files = manifest["files"]
+    tag = f".dotsetup-{os.getpid()}"
+    staged: Dict[str, Path] = {}  # Key -> staging path
+    swaps: List[Tuple[Path, Optional[Path]]] = []  # (destination, staged replacement or None to remove)
+    meta: List[Tuple[Path, Dict[str, Any]]] = []
+    for name, dest in targets.items():
+        plan = plans[name]
+        for key in sorted(plan):
+            action = plan[key]
+            final = entry_path(dest, name, key)
+            if action == "meta":
+                meta.append((final, files[key]))
+                continue
+            # Entries below a replaced or removed directory go with it
+            parts = key.split("/")
+            ancestors = ("/".join(parts[:i]) for i in range(1, len(parts)))
+            outer = [a for a in ancestors if plan.get(a) in ("write", "remove")]
+            if outer:
+                if action == "write":
+                    staged[key] = staged[outer[-1]] / Path(key).relative_to(outer[-1])
+                continue
+            stage = final.with_name(f".{final.name}{tag}-new") if action == "write" else None
+            if stage is not None:
+                staged[key] = stage
+            swaps.append((final, stage))
+
+    created: List[Path] = []  # Missing parent directories made for staging
+    committed: List[Tuple[Path, Optional[Path]]] = []  # (destination, where its old entry was moved)
+    old_meta: List[Tuple[Path, os.stat_result]] = []
+    try:
+        for final, stage in swaps:
+            for parent in reversed([final.parent, *final.parent.parents]):
+                if stage is not None and not parent.exists():
+                    parent.mkdir()
+                    created.append(parent)
+        write_entries(backup_dir, manifest, staged)
+
+        for final, stage in swaps:
+            aside = None
+            if final.exists() or final.is_symlink():
+                aside = final.with_name(f".{final.name}{tag}-old")
+                os.replace(final, aside)
+            committed.append((final, aside))
+            if stage is not None:
+                os.replace(stage, final)
+
+        # Metadata last, children first, a read-only directory would block the rest
+        for final, record in reversed(meta):
+            old_meta.append((final, final.lstat()))
+            if record["type"] == "file":
+                os.utime(final, ns=(record["mtime"], record["mtime"]))
+            final.chmod(record["mode"])
+    except BaseException:
+        for final, st in reversed(old_meta):
+            try:
+                os.utime(final, ns=(st.st_atime_ns, st.st_mtime_ns))
+                final.chmod(st.st_mode & 0o7777)
+            except OSError:
+                pass
+        for final, aside in reversed(committed):
+            try:
+                discard(final)
+                if aside is not None:
+                    os.replace(aside, final)
+            except OSError as e:
+                print(f" Warning: Could not roll back {final} ({e}), its previous contents are in {aside}")
+        for _, stage in swaps:
+            if stage is not None:
+                try:
+                    discard(stage)
+                except OSError:
+                    pass
+        for parent in reversed(created):
+            try:
+                parent.rmdir()
+            except OSError:
+                pass
+        raise
+
+    # Everything is in place, drop what was replaced
+    for _, aside in committed:
+        if aside is not None:
+            try:
+                discard(aside)
+            except OSError as e:
+                print(f" Warning: Could not remove {aside}: {e}")
+
+
+def catalog_record(manifest: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Summarize a snapshot manifest as a catalog record.
+    """
+    files = [(key, record) for key, record in manifest["files"].items() if record["type"] == "file"]
+    return {
+        "op": "add",
+        "timestamp": manifest["timestamp"],
+        "items": len(manifest["roots"]),
+        "bytes": sum(record.get("size", 0) for _, record in files),
+        "files": {key: record.get("digest") for key, record in files},
+    }
+
+
+def append_catalog(record: Dict[str, Any]) -> None:
+    """
+    Append one record to the backup catalog.
+    """
+    import json
+
+    catalog = Path(SETTINGS["backup_path"]).expanduser() / BACKUP_CATALOG
+    if not catalog.exists():
+        # First catalog write: index every snapshot already on disk
+        rebuild_catalog()
+    with open(catalog, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+def catalog_summary(record: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The part of a catalog record that listing and selecting need (no
+    per-file digests).
+    """
+    return {key: record[key] for key in ("timestamp", "items", "bytes") if key in record}
+
+
+def save_catalog_state(backup_base: Path, size: int, entries: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Save the catalog state: the snapshot summaries after replaying the
+    first `size` bytes of the catalog log.
+    """
+    import json
+
+    tmp_path = backup_base / f"{BACKUP_CATALOG_STATE}.tmp{os.getpid()}"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"size": size, "snapshots": entries}, f, sort_keys=True)
+        os.replace(tmp_path, backup_base / BACKUP_CATALOG_STATE)
+    except OSError:
+        pass  # Read-only backup directory: the next load replays the log again
+
+
+def load_catalog() -> Dict[str, Dict[str, Any]]:
+    """
+    Load the backup catalog: timestamp -> snapshot summary (timestamp,
+    items, bytes), oldest first.
+
+    The summaries come from the catalog state file. Only log records
+    appended since it was saved ("add" and "remove") are replayed, so a
+    listing reads one small file instead of every per-file digest. A missing
+    catalog is rebuilt from the snapshot directories.
+    """
+    import json
+
+    backup_base = Path(SETTINGS["backup_path"]).expanduser()
+    try:
+        log = open(backup_base / BACKUP_CATALOG, "rb")
+    except FileNotFoundError:
+        return rebuild_catalog()
+
+    with log:
+        size = os.fstat(log.fileno()).st_size
+        entries: Dict[str, Dict[str, Any]] = {}
+        offset = 0
+        try:
+            with open(backup_base / BACKUP_CATALOG_STATE, encoding="utf-8") as f:
+                state = json.load(f)
+            if state["size"] <= size:
+                entries, offset = state["snapshots"], state["size"]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # Missing or unreadable state: replay the whole log
+        if offset == size:
+            return entries
+        log.seek(offset)
+        tail = log.read(size - offset)
+
+    # A torn last line (interrupted write) is left for the next load
+    consumed = tail.rfind(b"\n") + 1
+    for line in tail[:consumed].splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue  # Torn write from an interrupted run
+        if record.get("op") == "add":
+            entries[record["timestamp"]] = catalog_summary(record)
+        elif record.get("op") == "remove":
+            entries.pop(record["timestamp"], None)
+    entries = dict(sorted(entries.items()))
+    save_catalog_state(backup_base, offset + consumed, entries)
+    return entries
+
+
+def rebuild_catalog() -> Dict[str, Dict[str, Any]]:
+    """
+    Rebuild the backup catalog by scanning the snapshot directories.
+
+    Scans backup directory for subdirectories matching YYYYMMDD_HHMMSS format.
+    Used when the catalog is missing or has drifted from what is on disk.
+    Snapshots still being written are skipped (see is_complete_snapshot()).
+
+    Returns:
+        timestamp -> snapshot summary, oldest first
+    """
+    import json
+
+    backup_base = Path(SETTINGS["backup_path"]).expanduser()
+    if not backup_base.exists():
+        return {}
+
+    # Get all directories that match timestamp format YYYYMMDD_HHMMSS
+    backups = sorted(d for d in backup_base.iterdir() if d.is_dir() and d.name.replace("_", "").isdigit())
+    records = [catalog_record(load_manifest(d)) for d in backups if is_complete_snapshot(d)]
+
+    tmp_path = backup_base / f"{BACKUP_CATALOG}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+        size = f.tell()
+    os.replace(tmp_path, backup_base / BACKUP_CATALOG)
+    entries = {record["timestamp"]: catalog_summary(record) for record in records}
+    save_catalog_state(backup_base, size, entries)
+    return entries
+
+
+def is_complete_snapshot(backup_dir: Path) -> bool:
+    """
+    Whether a snapshot directory holds a finished snapshot: it has a
+    manifest, or it is a plain copy from before manifests existed. Store
+    and archive snapshots still being written have no manifest yet and are
+    empty or hold only their archive.
+    """
+    if (backup_dir / BACKUP_MANIFEST).exists():
+        return True
+    entries = [entry.name for entry in backup_dir.iterdir()]
+    return bool(entries) and not any(name.startswith("snapshot.tar") for name in entries)
+
+
+def list_backups() -> list[Path]:
+    """
+    List all available backups sorted by timestamp (oldest first).
+
+    Reads the backup catalog (see load_catalog()) instead of scanning
+    the backup directory.
+
+    Returns:
+        List of Path objects for backup directories, sorted oldest to newest
+    """
+    backup_base = Path(SETTINGS["backup_path"]).expanduser()
+    return [backup_base / timestamp for timestamp in load_catalog()]
+
+
+def select_retained(snapshots: Dict[str, Dict[str, Any]], policy: Dict[str, int]) -> Dict[str, List[str]]:
+    """
+    Apply a retention policy to snapshots (timestamp -> manifest).
+
+    The policy only counts full snapshots, and the newest full snapshot is
+    always kept. Partial snapshots (the safety backups install and restore
+    take) are kept until a newer retained full snapshot covers all of their
+    roots; until then they may hold the only copy of what they saved.
+
+    Returns:
+        timestamp -> reasons it is kept ("last", "daily", "weekly",
+        "newest", "uncovered"); snapshots not in the result are to be pruned
+    """
+    import datetime
+
+    keep: Dict[str, List[str]] = {}
+    newest_first = sorted((t for t, manifest in snapshots.items() if not manifest.get("partial")), reverse=True)
+    for timestamp in newest_first[: policy.get("last", 0)]:
+        keep.setdefault(timestamp, []).append("last")
+
+    def bucket_rule(reason: str, count: int, bucket_of: Any) -> None:
+        seen: List[Any] = []
+        for timestamp in newest_first:
+            try:
+                dt = datetime.datetime.strptime(timestamp[:15], "%Y%m%d_%H%M%S")
+            except ValueError:
+                continue
+            bucket = bucket_of(dt)
+            if bucket in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.append(bucket)
+            keep.setdefault(timestamp, []).append(reason)
+
+    bucket_rule("daily", policy.get("daily", 0), lambda dt: dt.date())
+    bucket_rule("weekly", policy.get("weekly", 0), lambda dt: dt.isocalendar()[:2])
+
+    # Never prune the newest full snapshot
+    if newest_first and newest_first[0] not in keep:
+        keep[newest_first[0]] = ["newest"]
+
+    retained_full = [(t, set(snapshots[t]["roots"])) for t in keep]
+    for timestamp, manifest in snapshots.items():
+        if not manifest.get("partial"):
+            continue
+        roots = set(manifest["roots"])
+        if not any(t > timestamp and roots <= full_roots for t, full_roots in retained_full):
+            keep[timestamp] = ["uncovered"]
+    return dict(sorted(keep.items()))
+
+
+def snapshot_freed_bytes(backup_dir: Path) -> int:
+    """
+    Bytes released by deleting a snapshot directory. Files still hardlinked
+    from another snapshot (or the object store) release nothing.
+    """
+    freed = 0
+    for root, _, files in os.walk(backup_dir):
+        for entry in files:
+            try:
+                st = os.lstat(os.path.join(root, entry))
+            except OSError:
+                continue
+            if st.st_nlink == 1:
+                freed += st.st_size
+    return freed
+
+
+def collect_garbage(backup_base: Path, keep_dirs: List[Path], grace_seconds: float = 3600) -> Tuple[int, int]:
+    """
+    Delete object store blobs no remaining snapshot references.
+
+    References are taken from the manifests of every snapshot directory
+    that remains, so shared content is only dropped once nothing uses it.
+    If any of them cannot be read, nothing is deleted. Blobs written or
+    reused (their mtime is refreshed) in the last grace_seconds are kept in
+    case a backup running concurrently has not yet written its manifest.
+
+    Returns:
+        (blobs deleted, bytes freed)
+    """
+    import time
+
+    objects = backup_base / BACKUP_OBJECTS
+    if not objects.is_dir():
+        return 0, 0
+
+    referenced = set()
+    for backup_dir in keep_dirs:
+        try:
+            manifest = load_manifest(backup_dir)
+        except (OSError, ValueError) as e:
+            print(f" Warning: Skipped object garbage collection, could not read {backup_dir.name}: {e}")
+            return 0, 0
+        for record in manifest["files"].values():
+            if record.get("digest"):
+                referenced.add(record["digest"])
+
+    deleted = 0
+    freed = 0
+    cutoff = time.time() - grace_seconds
+    for prefix in objects.iterdir():
+        if not (prefix.is_dir() and len(prefix.name) == 2):
+            continue
+        for blob in prefix.iterdir():
+            if prefix.name + blob.name in referenced:
+                continue
+            st = blob.lstat()
+            if st.st_mtime > cutoff:
+                continue
+            blob.unlink()
+            deleted += 1
+            if st.st_nlink == 1:
+                freed += st.st_size
+        try:
+            prefix.rmdir()  # Only succeeds once empty
+        except OSError:
+            pass
+    return deleted, freed
+
+
+def prune_backups() -> None:
+    """
+    Delete snapshots outside SETTINGS["backup_retention"] and garbage-collect
+    the object store.
+
+    Each removal is recorded in the catalog before its directory is deleted,
+    so an interrupted prune never leaves the catalog pointing at a
+    half-deleted snapshot.
+    """
+    import shutil
 
+    backup_base = Path(SETTINGS["backup_path"]).expanduser()
+    catalog = load_catalog()
+    manifests = {}
+    unreadable = []
+    for timestamp in catalog:
+        if not (backup_base / timestamp).is_dir():
+            continue  # Already gone from disk, only its catalog entry is dropped
+        try:
+            manifests[timestamp] = load_manifest(backup_base / timestamp)
+        except (OSError, ValueError) as e:
+            # Unreadable snapshots are kept, never judged
+            print(f" Warning: Could not read {timestamp}: {e}")
+            unreadable.append(timestamp)
+    keep = select_retained(manifests, SETTINGS["backup_retention"])
+    keep.update((timestamp, ["unreadable"]) for timestamp in unreadable)
 
-def create_sys_links() -> None:
-    """
-    Create symlinks from dotfiles to standard home directory locations.
+    print()
+    box_draw("Pruning Backups")
+    print()
 
-    Removes any existing files/links/directories at destination before linking.
-    Creates these symlinks:
-    - {DOT_FILES}/vim -> ~/.vim
-    - {DOT_FILES}/vim/vimrc -> ~/.vimrc
-    - {DOT_FILES}/tmux/tmux.conf -> ~/.tmux.conf
-    - {DOT_FILES}/git/gitconfig -> ~/.gitconfig
-    - {DOT_FILES}/nvim/init.vim -> ~/.config/nvim/init.vim
-    """
-    home = SYSTEM.home
-    dot_files = SYSTEM.script_dir
-    symlinks = {
-        dot_files / "vim": home / ".vim",
-        dot_files / "vim" / "vimrc": home / ".vimrc",
-        dot_files / "tmux" / "tmux.conf": home / ".tmux.conf",
-        dot_files / "git" / "gitconfig": home / ".gitconfig",
-        dot_files / "nvim" / "init.vim": home / ".config" / "nvim" / "init.vim",
-    }
-    print("\nCreating symlinks")
+    freed = 0
+    pruned = 0
+    for timestamp in catalog:
+        if timestamp in keep:
+            continue
+        backup_dir = backup_base / timestamp
+        append_catalog({"op": "remove", "timestamp": timestamp})
+        if backup_dir.is_dir():
+            freed += snapshot_freed_bytes(backup_dir)
+            shutil.rmtree(backup_dir)
+        pruned += 1
+        print(f" Pruned: {timestamp}")
+
+    # Snapshot directories on disk that the catalog does not know about are
+    # kept too, the collector must not drop blobs they reference
+    keep_dirs = [
+        d
+        for d in (backup_base.iterdir() if backup_base.is_dir() else [])
+        if d.is_dir() and d.name.replace("_", "").isdigit()
+    ]
+    blobs, blob_bytes = collect_garbage(backup_base, keep_dirs)
+    freed += blob_bytes
 
-    for src, dest in symlinks.items():
-        print(f" {str(src)} -> {str(dest)}")
-        safe_symlink(src, dest)
+    for timestamp, reasons in keep.items():
+        print(f" Kept  : {timestamp} ({', '.join(reasons)})")
+    print(f"\nPrune complete! {pruned} snapshot(s) and {blobs} unreferenced object(s) removed.")
+    print(f"Space freed: {format_bytes(freed)}\n")
 
 
-def export_dot_files() -> None:
+def format_bytes(size: float) -> str:
     """
-    Export DOT_FILES environment variable to shell configuration files.
+    Format a byte count for humans, e.g. 1536 -> "1.5 KiB".
+    """
+    for unit in ["B", "KiB", "MiB", "GiB"]:
+        if size < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
 
-    Appends to ~/.bashrc, ~/.bash_profile, and/or ~/.zshrc depending on OS.
-    Adds three lines:
-    - export DOT_FILES={script_dir}
-    - export CLICOLOR=1
-    - source $DOT_FILES/shell/autorun.sh
 
-    Safely handles existing lines to avoid duplicates, and updates
-    DOT_FILES path if it has changed.
+def reindex_backups() -> None:
     """
+    Rebuild the backup catalog from disk and report the result.
+    """
+    entries = rebuild_catalog()
+    print(f"\nBackup catalog rebuilt: {len(entries)} snapshot(s) indexed.")
+    print(f"Catalog: {Path(SETTINGS['backup_path']).expanduser() / BACKUP_CATALOG}\n")
 
-    def safe_append(fileName: Union[str, Path], exportLines: List[str]) -> None:
-        if not exportLines:
-            # No lines to export
-            return
 
-        file_path = Path(fileName).expanduser()
-        print(f"\n Processing: {file_path}")
+def diff_manifests(
+    old: Dict[str, Any], new: Dict[str, Any], old_dir: Optional[Path] = None, new_dir: Optional[Path] = None
+) -> Tuple[List[str], List[str], Dict[str, str]]:
+    """
+    Compare two manifests (snapshots or live_manifest()).
 
-        if not (file_path.is_file() or file_path.is_symlink()):
-            with open(file_path, "a"):
-                # Create file if does not exist
-                pass
+    Recorded digests are compared directly. A file without one (live, or a
+    legacy snapshot) is only hashed when its size matches but its mtime does
+    not; matching size and mtime count as unchanged. Only the entries a
+    partial snapshot holds are compared against it.
 
-        # Read existing file content
-        with open(file_path) as readFile:
-            existing_lines = readFile.readlines()
-
-        # Track which lines need to be added and in what order
-        lines_to_add = []
-        dotfiles_line = exportLines[0]  # export DOT_FILES=...
-        clicolor_line = exportLines[1]  # export CLICOLOR=1
-        autorun_line = exportLines[2]  # source $DOT_FILES/shell/autorun.sh
-
-        # Check for existing DOT_FILES, CLICOLOR, and autorun lines
-        has_dotfiles = False
-        has_clicolor = False
-        has_autorun = False
-        dotfiles_correct = False
-
-        for line in existing_lines:
-            if line.startswith("export DOT_FILES="):
-                has_dotfiles = True
-                if line == dotfiles_line:
-                    dotfiles_correct = True
-                    print(f"   ✓ DOT_FILES already set correctly: {line.strip()}")
-                else:
-                    print(f"   → Updating DOT_FILES from {line.strip()} to {dotfiles_line.strip()}")
-            elif line == clicolor_line:
-                has_clicolor = True
-                print(f"   ✓ Already exists: {line.strip()}")
-            elif line == autorun_line:
-                has_autorun = True
-                print(f"   ✓ Already exists: {line.strip()}")
-
-        # Determine what needs to be added/updated
-        if not has_dotfiles or not dotfiles_correct:
-            lines_to_add.append(dotfiles_line)
-        if not has_clicolor:
-            lines_to_add.append(clicolor_line)
-        if not has_autorun:
-            lines_to_add.append(autorun_line)
-
-        # If DOT_FILES path changed, we need to update the file
-        if has_dotfiles and not dotfiles_correct:
-            # Remove old DOT_FILES line and add new one in correct position
-            with open(file_path, "w") as writeFile:
-                for line in existing_lines:
-                    if not line.startswith("export DOT_FILES="):
-                        writeFile.write(line)
-            # Now append the new lines in order
-            with open(file_path, "a") as appendFile:
-                for exportLine in lines_to_add:
-                    print(f"   + Adding: {exportLine.strip()}")
-                    appendFile.write(exportLine)
-        elif lines_to_add:
-            # Just append missing lines
-            with open(file_path, "a") as appendFile:
-                for exportLine in lines_to_add:
-                    print(f"   + Adding: {exportLine.strip()}")
-                    appendFile.write(exportLine)
-        else:
-            print(f"   ✓ All lines already present")
+    Args:
+        old: Manifest to compare from
+        new: Manifest to compare to
+        old_dir: Snapshot directory of `old` (None for live)
+        new_dir: Snapshot directory of `new` (None for live)
 
-    print("\nExporting DOT_FILES environment variable")
-    exportLines = [
-        f"export DOT_FILES={str(SYSTEM.script_dir)}\n",
-        "export CLICOLOR=1\n",
-        "source $DOT_FILES/shell/autorun.sh\n",
-    ]
+    Returns:
+        (added keys, removed keys, modified key -> what changed)
+    """
 
-    if SYSTEM.os_kind == "Darwin":
-        print(" Darwin detected: Appending files '~/.bash_profile' and '~/.zshrc'")
+    def digest(manifest: Dict[str, Any], backup_dir: Optional[Path], key: str) -> str:
+        record = manifest["files"][key]
+        if not record.get("digest"):
+            if "path" in record:
+                path = Path(record["path"])
+            else:
+                path = snapshot_file_path(backup_dir or Path(), manifest, key)
+            record["digest"] = file_digest(path)
+        return record["digest"]
+
+    old_files = old["files"]
+    new_files = new["files"]
+    # A partial snapshot says nothing about the entries it does not hold
+    if old.get("partial"):
+        new_files = {k: v for k, v in new_files.items() if k in old_files}
+    if new.get("partial"):
+        old_files = {k: v for k, v in old_files.items() if k in new_files}
+    added = sorted(k for k in new_files if k not in old_files)
+    removed = sorted(k for k in old_files if k not in new_files)
+    modified: Dict[str, str] = {}
+    for key in sorted(k for k in new_files if k in old_files):
+        a = old_files[key]
+        b = new_files[key]
+        changes = []
+        if a["type"] != b["type"]:
+            changes.append(f"{a['type']} -> {b['type']}")
+        elif a["type"] == "link":
+            if a["target"] != b["target"]:
+                changes.append(f"target {a['target']} -> {b['target']}")
+        else:
+            if a["type"] == "file":
+                if a["size"] != b["size"]:
+                    changes.append("contents")
+                elif a.get("digest") and b.get("digest"):
+                    if a["digest"] != b["digest"]:
+                        changes.append("contents")
+                elif a["mtime"] != b["mtime"]:
+                    if digest(old, old_dir, key) != digest(new, new_dir, key):
+                        changes.append("contents")
+            if a["mode"] != b["mode"]:
+                changes.append(f"mode {a['mode']:o} -> {b['mode']:o}")
+        if changes:
+            modified[key] = ", ".join(changes)
+    return added, removed, modified
+
+
+def resolve_snapshot(operand: str) -> Optional[Tuple[str, Dict[str, Any], Optional[Path]]]:
+    """
+    Resolve a --backup-diff operand: "live", a backup number from
+    --backup-list, or a snapshot name.
 
-        # ~/.bash_profile
-        safe_append(SYSTEM.home / ".bash_profile", exportLines)
+    Returns:
+        (label, manifest, snapshot directory or None for live), or None if
+        there is no such backup
+    """
+    if operand == "live":
+        return "live", live_manifest(), None
 
-        # ~/.zshrc with zsh-specific prompt
-        safe_append(
-            SYSTEM.home / ".zshrc",
-            [*exportLines, "prompt='%F{028}%n@%m %F{025}%~%f %% '"],
-        )
+    backups = list_backups()
+    backup_dir = None
+    if operand.isdigit():
+        if 1 <= int(operand) <= len(backups):
+            backup_dir = backups[int(operand) - 1]
     else:
-        # Linux and other systems: support both bash and zsh
-        print(" Appending to '~/.bashrc' and '~/.zshrc'")
+        backup_dir = next((d for d in backups if d.name == operand), None)
+    if backup_dir is None or not backup_dir.is_dir():
+        return None
+    manifest = load_manifest(backup_dir)
+    label = f"{backup_dir.name} (partial)" if manifest.get("partial") else backup_dir.name
+    return label, manifest, backup_dir
 
-        # ~/.bashrc for bash (if it exists)
-        bashrc_path = SYSTEM.home / ".bashrc"
-        if bashrc_path.is_file():
-            safe_append(bashrc_path, exportLines)
 
-        # ~/.zshrc for zsh (if it exists or user uses zsh)
-        zshrc_path = SYSTEM.home / ".zshrc"
-        if zshrc_path.is_file() or zshrc_path.is_symlink() or os.environ.get("SHELL", "").endswith("zsh"):
-            safe_append(zshrc_path, exportLines)
-
-
-def backup_all() -> None:
+def display_backup_diff(old_operand: str, new_operand: str) -> None:
     """
-    Create a backup of all dotfiles and system configurations without making any changes
+    Show what changed between two backups, or between a backup and the live files.
+
+    Args:
+        old_operand: Backup number, snapshot name or "live" to compare from
+        new_operand: Backup number, snapshot name or "live" to compare to
     """
-    # Create timestamped backup directory
-    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_base = Path(SETTINGS["backup_path"]).expanduser()
-    backup_dir = backup_base / timestamp
-    backup_dir.mkdir(parents=True, exist_ok=True)
+    sides = []
+    for operand in (old_operand, new_operand):
+        side = resolve_snapshot(operand)
+        if side is None:
+            print(f"\nError: No backup {operand!r}. Use a number from --backup-list, a snapshot name or 'live'.\n")
+            return
+        sides.append(side)
+    (old_label, old, old_dir), (new_label, new, new_dir) = sides
+
+    added, removed, modified = diff_manifests(old, new, old_dir, new_dir)
+
+    def collapse(keys: List[str]) -> List[str]:
+        # Show an added or removed directory once, with its entry count
+        key_set = set(keys)
+        below: Dict[str, int] = {}
+        for key in keys:
+            parts = key.split("/")
+            ancestors = ("/".join(parts[:i]) for i in range(1, len(parts)))
+            top = next((a for a in ancestors if a in key_set), key)
+            below[top] = below.get(top, -1) + 1
+        return [f"{key} ({count} entries)" if count else key for key, count in below.items()]
+
+    lines = [f"From: {old_label}", f"To  : {new_label}"]
+    for heading, mark, color, entries in (
+        ("ADDED", "+", Colors.GREEN, collapse(added)),
+        ("REMOVED", "-", Colors.RED, collapse(removed)),
+        ("MODIFIED", "~", Colors.YELLOW, [f"{key} ({what})" for key, what in modified.items()]),
+    ):
+        if entries:
+            lines.append(f"\x01 {heading}")
+            lines.extend(f"{color}{mark}{Colors.RESET} {entry}" for entry in entries)
+
+    lines.extend([
+        "\x01 ",
+        f"{len(added)} added, {len(removed)} removed, {len(modified)} modified",
+    ])
 
     print()
-    box_draw("Creating Backup")
-    print(f"\nBackup directory: {backup_dir}\n")
+    box_draw(lines, title="DIFF")
+    print()
 
-    home = SYSTEM.home
-    dot_files = SYSTEM.script_dir
-
-    # List of files and directories to backup
-    files_to_backup = [
-        # Dotfiles directory configs
-        dot_files / "vim" / "user.vim",
-        dot_files / "git" / "gitconfig",
-        # Home directory configs
-        home / ".vim",
-        home / ".vimrc",
-        home / ".tmux.conf",
-        home / ".gitconfig",
-        home / ".config" / "nvim" / "init.vim",
-        # Shell RC files
-        home / ".bashrc",
-        home / ".bash_profile",
-        home / ".zshrc",
-    ]
 
-    backed_up_count = 0
-    for file_path in files_to_backup:
-        fp = Path(file_path).expanduser()
-        if fp.exists() or fp.is_symlink():
-            if backup_file(fp, backup_dir):
-                backed_up_count += 1
+def verify_backups(selection: str = "all", deep: bool = False) -> bool:
+    """
+    Check that snapshots still hold the data their manifests describe.
 
-    print(f"\nBackup complete! {backed_up_count} file(s)/directory(ies) backed up.")
-    print(f"Backup location: {backup_dir}\n")
+    Stored files are re-hashed on SETTINGS["jobs"] threads (see
+    mmap_digest()); content shared by several snapshots is hashed once.
+    Unless deep is set, a stored file whose stat tuple still matches the
+    one recorded at backup time is trusted without being read, so a
+    nightly check only reads data that changed since it was written.
+    Archives are streamed once and every member is hashed.
 
+    Args:
+        selection: Backup number from --backup-list, or "all"
+        deep: Re-hash everything, even data whose stat is unchanged
 
-def list_backups() -> list[Path]:
+    Returns:
+        True if every checked snapshot is intact
     """
-    List all available backups sorted by timestamp (oldest first).
+    import hashlib
+    import tarfile
+    from concurrent.futures import ThreadPoolExecutor
 
-    Scans backup directory for subdirectories matching YYYYMMDD_HHMMSS format.
+    backups = list_backups()
+    if selection == "all":
+        selected = backups
+    elif selection.isdigit() and 1 <= int(selection) <= len(backups):
+        selected = [backups[int(selection) - 1]]
+    else:
+        print(f"\nError: Invalid backup {selection!r}. Use a number from --backup-list or 'all'.\n")
+        return False
 
-    Returns:
-        List of Path objects for backup directories, sorted oldest to newest
-    """
-    backup_base = Path(SETTINGS["backup_path"]).expanduser()
-    if not backup_base.exists():
-        return []
+    problems: Dict[str, List[str]] = {d.name: [] for d in selected}
+    file_counts: Dict[str, int] = {d.name: 0 for d in selected}
+    # Stored file -> (digest, size, stored stat) and the (snapshot, key) pairs using it
+    checks: Dict[Path, Tuple[Optional[str], int, Optional[List[int]]]] = {}
+    owners: Dict[Path, List[Tuple[str, str]]] = {}
+    archives: List[Tuple[Path, Dict[str, Any]]] = []
+    for backup_dir in selected:
+        if not backup_dir.is_dir():
+            problems[backup_dir.name].append("snapshot directory is missing")
+            continue
+        manifest = load_manifest(backup_dir)
+        file_keys = [key for key, record in manifest["files"].items() if record["type"] == "file"]
+        file_counts[backup_dir.name] = len(file_keys)
+        if manifest["layout"] == "archive":
+            archives.append((backup_dir, manifest))
+            continue
+        for key in file_keys:
+            record = manifest["files"][key]
+            path = snapshot_file_path(backup_dir, manifest, key)
+            checks[path] = (record.get("digest"), record["size"], record.get("stored"))
+            owners.setdefault(path, []).append((backup_dir.name, key))
+
+    def check_file(path: Path) -> Tuple[Optional[str], bool]:
+        # (problem or None, whether the file was hashed)
+        digest, size, stored = checks[path]
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return "missing", False
+        if not deep and stored == [st.st_size, st.st_mtime_ns, st.st_ino]:
+            return None, False
+        if st.st_size != size:
+            return f"corrupt (size {st.st_size}, expected {size})", False
+        if digest is None:
+            return None, False  # Legacy snapshot, nothing to compare against
+        return (None if mmap_digest(path) == digest else "corrupt (checksum mismatch)"), True
+
+    def check_archive(backup_dir: Path, manifest: Dict[str, Any]) -> Tuple[List[str], int]:
+        # (problems, number of members hashed)
+        archive = backup_dir / manifest["archive"]
+        try:
+            st = archive.stat()
+        except FileNotFoundError:
+            return [f"{manifest['archive']}: missing"], 0
+        if not deep and manifest.get("archive_stat") == [st.st_size, st.st_mtime_ns, st.st_ino]:
+            return [], 0
+        files = manifest["files"]
+        wanted = {key for key, record in files.items() if record["type"] == "file"}
+        found = []
+        hashed = 0
+        try:
+            for key, reader in read_snapshot_files(backup_dir, manifest, wanted):
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: reader.read(1 << 20), b""):
+                    digest.update(chunk)
+                wanted.discard(key)
+                hashed += 1
+                if digest.hexdigest() != files[key]["digest"]:
+                    found.append(f"{key}: corrupt (checksum mismatch)")
+        except (OSError, tarfile.TarError) as e:
+            return found + [f"{manifest['archive']}: unreadable ({e})"], hashed
+        return found + [f"{key}: missing" for key in sorted(wanted)], hashed
+
+    with ThreadPoolExecutor(max_workers=SETTINGS["jobs"]) as pool:
+        archive_results = [pool.submit(check_archive, *a) for a in archives]
+        file_results = dict(zip(checks, pool.map(check_file, checks)))
+
+    hashed = 0
+    for path, (problem, was_hashed) in file_results.items():
+        hashed += was_hashed
+        if problem:
+            for timestamp, key in owners[path]:
+                problems[timestamp].append(f"{key}: {problem}")
+    for (backup_dir, _), future in zip(archives, archive_results):
+        found, count = future.result()
+        problems[backup_dir.name].extend(found)
+        hashed += count
+
+    lines = []
+    for timestamp, found in problems.items():
+        if found:
+            lines.append(f"{Colors.RED}✗{Colors.RESET} {timestamp}: {len(found)} problem(s)")
+            lines.extend(f"    {problem}" for problem in sorted(found))
+        else:
+            lines.append(f"{Colors.GREEN}✓{Colors.RESET} {timestamp}: OK ({file_counts[timestamp]} files)")
+    total = sum(len(found) for found in problems.values())
+    lines.extend([
+        "\x01 ",
+        f"{len(selected)} snapshot(s), {hashed} file(s) hashed{' (deep)' if deep else ''}, {total} problem(s)",
+    ])
 
-    # Get all directories that match timestamp format YYYYMMDD_HHMMSS
-    backups = [d for d in backup_base.iterdir() if d.is_dir() and d.name.replace("_", "").isdigit()]
-    # Sort by name (which is timestamp) - oldest first
-    backups.sort()
-    return backups
+    print()
+    box_draw(lines, title="VERIFY")
+    print()
+    return total == 0
 
 
 def display_backups() -> None:
     """
     Display all available backups in a human-readable format.
     """
-    backups = list_backups()
+    import datetime
 
-    if not backups:
+    catalog = load_catalog()
+
+    if not catalog:
         print("\nNo backups found.")
         print(f"Backup directory: {Path(SETTINGS['backup_path']).expanduser()}\n")
         return
@@ -1075,23 +3981,20 @@ def display_backups() -> None:
 
     # AVAILABLE section
     lines.append("\x01 AVAILABLE")
-    for i, backup_dir in enumerate(backups, 1):
-        timestamp = backup_dir.name
+    for i, (timestamp, record) in enumerate(catalog.items(), 1):
         # Parse timestamp for human-readable format
         try:
-            dt = datetime.datetime.strptime(timestamp, "%Y%m%d_%H%M%S")
+            dt = datetime.datetime.strptime(timestamp[:15], "%Y%m%d_%H%M%S")
             formatted = dt.strftime("%B %d, %Y at %I:%M:%S %p")
         except ValueError:
             formatted = timestamp
 
-        # Count files in backup
-        file_count = sum(1 for _ in backup_dir.iterdir())
-        lines.append(f"{i}: {formatted} ({file_count} items)")
+        lines.append(f"{i}: {formatted} ({record['items']} items, {format_bytes(record['bytes'])})")
 
     # Footer section
     lines.extend([
         "\x01 ",
-        f"Total backups: {len(backups)}",
+        f"Total backups: {len(catalog)}",
     ])
 
     box_draw(lines, title="BACKUPS")
@@ -1106,6 +4009,9 @@ def restore(backup_index: Optional[int] = None) -> None:
     Args:
         backup_index: Which backup to restore (1=oldest, 2=second oldest, etc.)
                      If None, auto-restore single backup or list all backups.
+
+    Restore is differential: only entries that differ from the snapshot are
+    backed up and rewritten (see plan_restore()).
     """
     backups = list_backups()
 
@@ -1133,121 +4039,413 @@ def restore(backup_index: Optional[int] = None) -> None:
 
     # Get the selected backup (1-indexed)
     backup_dir = backups[backup_index - 1]
+    if not backup_dir.is_dir():
+        print(f"\nError: Backup {backup_dir.name} is in the catalog but missing on disk.")
+        print("Run --backup-reindex to resync the catalog.\n")
+        return
+
+    # Map snapshot keys to their original locations
+    restore_map = backup_targets()
+
+    manifest = load_manifest(backup_dir)
+
+    # Work out what differs from the snapshot before touching anything
+    targets: Dict[str, Path] = {}
+    plans: Dict[str, Dict[str, str]] = {}
+    at_risk: List[str] = []
+    for backup_name, dest_path in restore_map.items():
+        if not any(k == backup_name or k.startswith(f"{backup_name}/") for k in manifest["files"]):
+            continue
+        targets[backup_name] = Path(dest_path)
+        plans[backup_name], existing = plan_restore(manifest, backup_name, targets[backup_name])
+        at_risk.extend(sorted(existing))
+
+    changed = [key for plan in plans.values() for key in plan]
+    if not changed:
+        print(f"\nNothing to restore, current files already match {backup_dir.name}.\n")
+        return
 
-    # Create a backup of current state before restoring
-    print("\nCreating backup of current state before restoring...")
-    backup_all()
+    # Back up only the existing entries that are about to change
+    if at_risk:
+        print("\nCreating backup of current state before restoring...")
+        if not backup_all(keys=at_risk):
+            print("Restore cancelled, no files were changed.\n")
+            return
 
     print()
     box_draw("Restoring Backup", title="Restore")
     print(f"\nRestoring from: {backup_dir}\n")
 
-    home = SYSTEM.home
-    dot_files = SYSTEM.script_dir
-
-    # Map backup filenames to their original locations
-    restore_map = {
-        "user.vim": dot_files / "vim" / "user.vim",
-        "gitconfig": dot_files / "git" / "gitconfig",
-        ".vim": home / ".vim",
-        ".vimrc": home / ".vimrc",
-        ".tmux.conf": home / ".tmux.conf",
-        ".gitconfig": home / ".gitconfig",
-        "init.vim": home / ".config" / "nvim" / "init.vim",
-        ".bashrc": home / ".bashrc",
-        ".bash_profile": home / ".bash_profile",
-        ".zshrc": home / ".zshrc",
-    }
+    try:
+        apply_restore_plan(backup_dir, manifest, targets, plans)
+    except OSError as e:
+        print(f" Error: {e}")
+        print("\nRestore failed and was rolled back, no files were changed.\n")
+        return
 
     restored_count = 0
-    for backup_name, dest_path in restore_map.items():
-        backup_file_path = backup_dir / backup_name
-        if not backup_file_path.exists():
+    for backup_name, dest in targets.items():
+        if not plans[backup_name]:
+            print(f" Unchanged: {dest}")
             continue
-
-        dest = Path(dest_path)
-
-        # Remove existing file/link/directory at destination
-        if dest.exists() or dest.is_symlink():
-            if dest.is_symlink():
-                dest.unlink()
-            elif dest.is_dir():
-                shutil.rmtree(dest)
-            else:
-                dest.unlink()
-
-        # Restore from backup
-        try:
-            if backup_file_path.is_dir():
-                shutil.copytree(backup_file_path, dest)
-                print(f" Restored directory: {dest}")
-            else:
-                dest.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(backup_file_path, dest)
-                print(f" Restored file: {dest}")
-            restored_count += 1
-        except Exception as e:
-            print(f" Warning: Failed to restore {dest}: {e}")
+        # A partial snapshot may hold entries below a target but not the target itself
+        record = manifest["files"].get(backup_name, {"type": "dir"})
+        if record["type"] == "link":
+            print(f" Restored link: {dest} -> {record['target']}")
+        elif record["type"] == "dir":
+            print(f" Restored directory: {dest} ({len(plans[backup_name])} entries changed)")
+        else:
+            print(f" Restored file: {dest}")
+        restored_count += 1
 
     print(f"\nRestore complete! {restored_count} file(s)/directory(ies) restored.\n")
 
 
-def install(skipUser: bool = False) -> None:
+def install(skipUser: bool = False, dry_run: bool = False) -> None:
     """
     Execute the full dotfiles installation workflow.
 
+    Every step (see install_steps()) first plans the changes it would make
+    and only those are applied, so a re-run on a converged system writes
+    nothing, not even a backup. Steps run concurrently once the backup and
+    the steps they depend on are done; a failed step skips its dependents.
+
     Steps:
-    1. Ensure ~/dotfiles symlink is correctly set up
-    2. Collect user information (unless skipUser=True)
-    3. Create user-specific vim and git configs
-    4. Backup existing configurations
-    5. Link/update ~/.gitconfig
-    6. Create required directories
-    7. Configure SSH connection multiplexing
-    8. Install minpac vim plugin manager
-    9. Create symlinks to home directory
-    10. Export DOT_FILES to shell configs
+    1. Collect user information (unless skipUser=True)
+    2. Backup the managed entries about to change
+    3. Ensure ~/dotfiles symlink is correctly set up
+    4. Create user-specific vim and git configs, then link/update ~/.gitconfig
+    5. Create required directories, then configure SSH connection multiplexing
+    6. Install the vim plugins (minpac included)
+    7. Create symlinks to home directory
+    8. Export DOT_FILES to shell configs
 
     Args:
         skipUser: If True, skip user data collection and use existing configs
+        dry_run: If True, only show the plan
     """
-    # Ensure ~/dotfiles points to the script directory
-    ensure_dotfiles_symlink()
+    # Fail on a conflicting ~/dotfiles before asking for anything
+    plan_dotfiles_symlink()
 
     user = None
     if not skipUser:
         user = ask_user_data()
 
-    create_user_vim(user)
-    create_user_git(user)
-    backup_all()  # Create complete backup before making any changes to external files
-    link_user_git(user)
-    create_folders()
-    configure_ssh_multiplexing()
-    install_minpac()
-    create_sys_links()
-    export_dot_files()
+    steps = install_steps(user)
+    plan = []
+    unplanned = False
+    for step in steps:
+        try:
+            plan.extend((step.name, change) for change in step.plan())
+        except OSError as e:
+            # Left to fail again when applied, where it only blocks its dependents
+            print(f"\nWarning: cannot plan step '{step.name}': {e}")
+            unplanned = True
+    if dry_run:
+        display_plan(plan)
+        return
+    if not plan and not unplanned:
+        print("\nNothing to do, everything is up to date\n")
+        return
+
+    # Back up what is about to change before making any changes to external files
+    names = {name for _, change in plan for name in managed_ids(change.target)}
+
+    def backup() -> None:
+        if names and not backup_all(names=names):
+            raise OSError("could not back up the files about to change")
+        print()
+        box_draw("Installing")
+        print()
+
+    def apply_step(step: InstallStep) -> None:
+        # Re-plan: a step it depends on may have changed what it has to do
+        for change in step.plan():
+            # One write per line, steps run concurrently
+            sys.stdout.write(f" {step.name}: {change.action}: {change.target}\n")
+            change.apply()
+
+    tasks = {"backup": (backup, ())}
+    for step in steps:
+        tasks[step.name] = (lambda step=step: apply_step(step), ("backup", *step.after))
+    status = run_graph(tasks, SETTINGS["jobs"])
+
+    unfinished = [f"{name}: {result}" for name, result in status.items() if result != "done"]
+    if unfinished:
+        print()
+        box_draw(unfinished, title="INSTALL INCOMPLETE")
+        print()
+        sys.exit(1)
+
     print()
     box_draw("Final Steps")
     print()
-    print(" 1. For vim 8.0>: run `vim +PackUpdate`")
-    print("    For vim <7.4: run `vim`")
-    print(" 2. Ignore any errors in vim and quit with `:q!`")
-    print(" 3. Close `exit` all terminal windows and reopen them to finish setup.")
+    print(" 1. Close `exit` all terminal windows and reopen them to finish setup.")
+    print(" 2. Update vim plugins later with `python3 DotSetup.py --plugins-update` (or `:PackUpdate`)")
     print()
 
 
-def main() -> None:
+def bench_startup(budget_ms: float, runs: int = 5) -> int:
     """
-    Main entry point for DotSetup.py script.
+    Measure the cold start of `python3 DotSetup.py --help`, the wall time a
+    user waits before any command does real work.
 
-    Parses command-line arguments and dispatches to appropriate functions:
-    - --install / --skip-user: Install dotfiles
-    - --status: Display system information
-    - --backup: Create backup of current configuration
-    - --backup-list: List all available backups
-    - --restore [N]: Restore from backup
+    The budget applies to that total (best of `runs` fresh interpreters).
+    It is broken down into interpreter startup, compiling DotSetup.py (a
+    script is never bytecode-cached) and loading it (imports and module
+    body), with the slowest imports from `python -X importtime`.
+
+    Args:
+        budget_ms: Maximum allowed cold start in milliseconds
+        runs: Number of fresh interpreters to sample
+
+    Returns:
+        Exit code: 0 within budget, 1 if over budget or measurement failed
+    """
+    import subprocess
+    import time
+
+    script = Path(__file__).resolve()
+    # Compile and run the module body the way `python3 DotSetup.py` does,
+    # without calling main()
+    probe = (
+        "import sys, time\n"
+        "source = open(sys.argv[1], encoding='utf-8').read()\n"
+        "start = time.perf_counter()\n"
+        "code = compile(source, sys.argv[1], 'exec')\n"
+        "loaded = time.perf_counter()\n"
+        "exec(code, {'__name__': '__bench__', '__file__': sys.argv[1]})\n"
+        "print((loaded - start) * 1000, (time.perf_counter() - loaded) * 1000)\n"
+    )
+
+    def sample(command: List[str]) -> Optional[Tuple[float, str, str]]:
+        """Best (wall ms, stdout, stderr) of `runs` fresh interpreters, None on failure"""
+        best: Optional[Tuple[float, str, str]] = None
+        for _ in range(runs):
+            start = time.perf_counter()
+            result = subprocess.run(command, cwd=str(script.parent), capture_output=True, text=True)
+            elapsed = (time.perf_counter() - start) * 1000
+            if result.returncode != 0:
+                print(f"Error: failed to run {script.name}:\n{result.stderr}")
+                return None
+            if best is None or elapsed < best[0]:
+                best = (elapsed, result.stdout, result.stderr)
+        return best
+
+    def top_level_imports(stderr: str) -> Dict[str, int]:
+        """Cumulative microseconds of each top-level module in -X importtime output"""
+        # Lines look like "import time:  self [us] | cumulative | [indent]name";
+        # top-level modules have no indent
+        imports: Dict[str, int] = {}
+        for line in stderr.splitlines():
+            parts = line.split("|")
+            if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2][1:].startswith(" "):
+                imports[parts[2].strip()] = int(parts[1])
+        return imports
+
+    interpreter = sample([sys.executable, "-X", "importtime", "-c", "pass"])
+    total = sample([sys.executable, str(script), "--help"])
+    traced = sample([sys.executable, "-X", "importtime", str(script), "--help"])
+    if interpreter is None or total is None or traced is None:
+        return 1
+
+    compile_ms = load_ms = float("inf")
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", probe, str(script)], capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"Error: failed to load {script.name}:\n{result.stderr}")
+            return 1
+        compiled, loaded = (float(ms) for ms in result.stdout.split())
+        compile_ms = min(compile_ms, compiled)
+        load_ms = min(load_ms, loaded)
+
+    # Modules the bare interpreter loads anyway (site, encodings, ...) are
+    # part of interpreter startup
+    preloaded = top_level_imports(interpreter[2])
+    imports = [(us, name) for name, us in top_level_imports(traced[2]).items() if name not in preloaded]
+
+    within = total[0] <= budget_ms
+    mark = f"{Colors.GREEN}✓{Colors.RESET}" if within else f"{Colors.RED}✗{Colors.RESET}"
+    lines = [
+        f"{mark} Cold start :  {total[0]:7.2f} ms",
+        f"  Budget     :  {budget_ms:7.2f} ms",
+        f"  Interpreter:  {interpreter[0]:7.2f} ms",
+        f"  Compile    :  {compile_ms:7.2f} ms",
+        f"  Load       :  {load_ms:7.2f} ms",
+        f"  Samples    :  {runs} (best)",
+        "\x01 SLOWEST IMPORTS",
+    ]
+    for us, name in sorted(imports, reverse=True)[:8]:
+        lines.append(f"{us / 1000:7.2f} ms  {name}")
+    box_draw(lines, title="STARTUP")
+    return 0 if within else 1
+
+
+def instrument_autorun(source: str, shell: str) -> str:
+    """
+    Rewrite shell/autorun.sh so every function it defines logs its wall time.
+
+    Each function `F` is renamed `__dotsetup_F` and wrapped by a new `F` that
+    appends "F start end" (from $EPOCHREALTIME) to $DOTSETUP_PROFILE_OUT, so
+    calls between functions, including main(), still go through the wrappers.
+
+    Args:
+        source: Contents of autorun.sh
+        shell: "bash" or "zsh"
+
+    Returns:
+        Script that defines the instrumented functions and runs main
+    """
+    functions = re.findall(r"^(\w+)\(\)\s*\{", source, flags=re.M)
+    body = re.sub(r"^(\w+)(\(\)\s*\{)", r"__dotsetup_\1\2", source, flags=re.M)
+    body = re.sub(r"^main\s+\"\$@\".*$", "", body, flags=re.M)  # Run below, after the wrappers
+
+    lines = ["zmodload zsh/datetime"] if shell == "zsh" else []
+    lines.append(body)
+    for name in functions:
+        lines.append(
+            f"{name}() {{ local __t0=$EPOCHREALTIME; __dotsetup_{name} \"$@\"; local __rc=$?; "
+            f"printf '%s %s %s\\n' {name} \"$__t0\" \"$EPOCHREALTIME\" >> \"$DOTSETUP_PROFILE_OUT\"; "
+            "return $__rc; }"
+        )
+    lines.append('main "$@"')
+    return "\n".join(lines) + "\n"
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of a non-empty list.
+    """
+    import math
+
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def profile_shell(runs: int) -> int:
+    """
+    Time every function of shell/autorun.sh in fresh interactive shells.
+
+    Starts `runs` interactive bash and zsh shells (whichever are installed,
+    without reading any rc file) that source an instrumented copy of
+    autorun.sh (see instrument_autorun()), and reports the mean and p95 wall
+    time of each function. Results are appended to
+    $XDG_CACHE_HOME/dotsetup/shell-profile.jsonl together with the dotfiles
+    revision, and compared with the previous run of the same shell.
+
+    Args:
+        runs: Number of shells to start per shell kind
+
+    Returns:
+        Exit code: 0 if a shell was profiled, 1 otherwise
+    """
+    import datetime
+    import json
+    import shutil
+    import subprocess
+    import tempfile
+
+    autorun = SYSTEM.script_dir / "shell" / "autorun.sh"
+    source = autorun.read_text()
+    try:
+        revision = run_git(["-C", str(SYSTEM.script_dir), "describe", "--always", "--dirty"]).strip()
+    except OSError:
+        revision = None
+    history_path = get_cache_dir() / "shell-profile.jsonl"
+    previous: Dict[str, Dict[str, Any]] = {}
+    try:
+        with open(history_path) as f:
+            for line in f:
+                record = json.loads(line)
+                previous[record["shell"]] = record
+    except FileNotFoundError:
+        pass
+
+    # Profile the plain terminal path, as autorun.sh sees a fresh login
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("VSCODE_", "TERM_PROGRAM", "DOT_FILES"))}
+    env["DOT_FILES"] = str(SYSTEM.script_dir)
+
+    lines = [f"Runs: {runs} per shell   Revision: {revision or 'unknown'}"]
+    records = []
+    with tempfile.TemporaryDirectory(prefix="dotsetup-profile-") as tmp:
+        for shell, argv in (("bash", ["--norc", "--noprofile", "-i", "-c"]), ("zsh", ["-f", "-i", "-c"])):
+            binary = shutil.which(shell)
+            if binary is None:
+                continue
+            script = Path(tmp) / f"autorun.{shell}"
+            script.write_text(instrument_autorun(source, shell))
+            out = Path(tmp) / f"{shell}.out"
+
+            samples: Dict[str, List[float]] = {}
+            for _ in range(runs):
+                out.write_text("")
+                try:
+                    subprocess.run(
+                        [binary, *argv, f'source "{script}"'],
+                        env={**env, "SHELL": binary, "DOTSETUP_PROFILE_OUT": str(out)},
+                        stdin=subprocess.DEVNULL,
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL,
+                        timeout=SETTINGS["probe_timeout"] * 6,
+                    )
+                except subprocess.TimeoutExpired:
+                    print(f"Warning: {shell} did not finish autorun.sh, skipping that run")
+                    continue
+                for entry in out.read_text().splitlines():
+                    # Some locales print $EPOCHREALTIME with a decimal comma
+                    name, start, end = entry.replace(",", ".").split()
+                    samples.setdefault(name, []).append((float(end) - float(start)) * 1000)
+
+            if not samples:
+                print(f"Warning: {shell} reported no timings (needs $EPOCHREALTIME: bash 5 or zsh)")
+                continue
+
+            stats = {
+                name: {"mean": sum(times) / len(times), "p95": percentile(times, 0.95), "calls": len(times)}
+                for name, times in samples.items()
+            }
+            records.append(
+                {
+                    "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                    "revision": revision,
+                    "autorun": file_digest(autorun)[:12],
+                    "shell": shell,
+                    "runs": runs,
+                    "functions": stats,
+                }
+            )
+
+            old = previous.get(shell, {}).get("functions", {})
+            since = previous.get(shell, {}).get("revision") or previous.get(shell, {}).get("timestamp")
+            lines.append(f"\x01 {shell.upper()} (ms)")
+            lines.append(f"{'function':<24}{'mean':>9}{'p95':>9}{'Δ mean':>10}")
+            for name, stat in sorted(stats.items(), key=lambda item: -item[1]["mean"]):
+                delta = f"{stat['mean'] - old[name]['mean']:+10.1f}" if name in old else f"{'':>10}"
+                lines.append(f"{name:<24}{stat['mean']:9.1f}{stat['p95']:9.1f}{delta}")
+            if old:
+                lines.append(f"Δ mean vs previous profile ({since})")
+
+    if not records:
+        print("\nError: no shell could be profiled\n")
+        return 1
+
+    history_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(history_path, "a") as f:
+        for record in records:
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    print()
+    box_draw(lines, title="SHELL PROFILE")
+    print(f"\nResults saved to {history_path}\n")
+    return 0
+
+
+def build_parser() -> "argparse.ArgumentParser":
+    """
+    Build the command line parser.
     """
+    import argparse
+
     # Processor for command line arguments
     parser = argparse.ArgumentParser()
 
@@ -1267,6 +4465,75 @@ def main() -> None:
         action="store_true",
         default=False,
     )
+    xorgroup.add_argument(
+        "--backup-diff",
+        help="Show what changed between two backups (number from --backup-list, snapshot name or 'live')",
+        nargs=2,
+        metavar=("A", "B"),
+    )
+    xorgroup.add_argument(
+        "--backup-verify",
+        help="Check backups for corrupt or missing data (number from --backup-list, or 'all')",
+        nargs="?",
+        const="all",
+        metavar="N|all",
+    )
+    xorgroup.add_argument(
+        "--backup-prune",
+        help="Delete backups outside the retention policy and reclaim unused space",
+        action="store_true",
+        default=False,
+    )
+    xorgroup.add_argument(
+        "--backup-reindex",
+        help="Rebuild the backup catalog from the snapshot directories",
+        action="store_true",
+        default=False,
+    )
+    xorgroup.add_argument(
+        "--plugins-sync",
+        help="Install missing vim plugins and check out the commits pinned in the lockfile",
+        action="store_true",
+        default=False,
+    )
+    xorgroup.add_argument(
+        "--plugins-update",
+        help="Update every vim plugin to its latest commit and pin it in the lockfile",
+        action="store_true",
+        default=False,
+    )
+    xorgroup.add_argument(
+        "--plugins-mirror",
+        help="Create or refresh the local mirror cache of the vim plugins",
+        action="store_true",
+        default=False,
+    )
+    xorgroup.add_argument(
+        "--bundle-create",
+        help="Write the dotfiles and all vim plugins into one compressed archive for offline installs",
+        nargs="?",
+        const="",
+        metavar="BUNDLE",
+    )
+    xorgroup.add_argument(
+        "--bundle-install",
+        help="Install from a bundle made by --bundle-create, without network access",
+        metavar="BUNDLE",
+    )
+    xorgroup.add_argument(
+        "--profile-shell",
+        help="Time each shell/autorun.sh function in N fresh bash and zsh shells (default %(const)s)",
+        nargs="?",
+        type=int,
+        const=SETTINGS["profile_runs"],
+        metavar="N",
+    )
+    xorgroup.add_argument(
+        "--shell-init",
+        help="Rebuild the shell init snapshot sourced by shell/autorun.sh",
+        action="store_true",
+        default=False,
+    )
     xorgroup.add_argument(
         "--restore",
         help="Restore from backup (use --restore <number> to select specific backup)",
@@ -1291,32 +4558,163 @@ def main() -> None:
         default=False,
         dest="skipUser",
     )
+    parser.add_argument(
+        "--dry-run",
+        help="With --install / --skip-user, only show the changes that would be made",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--bench-startup",
+        help="Measure the cold start of DotSetup.py; exit 1 if over budget (default %(const)s ms)",
+        nargs="?",
+        type=float,
+        const=SETTINGS["startup_budget_ms"],
+        metavar="MS",
+    )
+    parser.add_argument(
+        "--backup-mode",
+        help="Backup storage for this run (default from SETTINGS: %(default)s)",
+        choices=["store", "link", "copy", "archive"],
+        default=SETTINGS["backup_mode"],
+    )
+    parser.add_argument(
+        "--bundle-dest",
+        help="With --bundle-install, where to put the dotfiles (default from SETTINGS: %(default)s)",
+        default=SETTINGS["dotfiles"],
+        metavar="DIR",
+    )
+    parser.add_argument(
+        "--deep",
+        help="With --backup-verify, re-hash everything instead of trusting unchanged stored files",
+        action="store_true",
+        default=False,
+    )
+    parser.add_argument(
+        "--jobs",
+        help="Worker threads copying backup files and cloning plugins (default from SETTINGS: %(default)s)",
+        type=int,
+        default=SETTINGS["jobs"],
+        metavar="N",
+    )
+    parser.add_argument(
+        "--refresh",
+        help="Re-probe tool versions instead of using cached results",
+        action="store_true",
+        default=False,
+    )
+
+    return parser
 
+
+def main() -> None:
+    """
+    Main entry point for DotSetup.py script.
+
+    Parses command-line arguments and dispatches to appropriate functions:
+    - --install / --skip-user [--dry-run]: Install dotfiles (or show the plan)
+    - --status: Display system information
+    - --backup: Create backup of current configuration
+    - --backup-list: List all available backups
+    - --backup-diff A B: Show changes between two backups (or 'live')
+    - --backup-verify [N|all] [--deep]: Check backups for corrupt or missing data
+    - --backup-prune: Apply the backup retention policy
+    - --backup-reindex: Rebuild the backup catalog
+    - --plugins-sync: Install vim plugins at their pinned commits
+    - --plugins-update: Update vim plugins and their pins
+    - --plugins-mirror: Create or refresh the plugin mirror cache
+    - --bundle-create [BUNDLE]: Write an offline bundle of the dotfiles and plugins
+    - --bundle-install BUNDLE [--bundle-dest DIR]: Install from an offline bundle
+    - --restore [N]: Restore from backup
+    - --bench-startup [MS]: Check the cold start time against a budget
+    - --profile-shell [N]: Time the shell startup functions
+    - --shell-init: Rebuild the shell init snapshot
+    """
     # Parse the given args
+    parser = build_parser()
     args = parser.parse_args()
 
+    if args.bench_startup is not None:
+        sys.exit(bench_startup(args.bench_startup))
+
     # If no arguments provided, display help
     if not (
-        args.install or args.skipUser or args.backup or args.backup_list or args.restore is not None or args.status
+        args.install
+        or args.skipUser
+        or args.backup
+        or args.backup_list
+        or args.backup_diff
+        or args.backup_verify
+        or args.backup_prune
+        or args.backup_reindex
+        or args.plugins_sync
+        or args.plugins_update
+        or args.plugins_mirror
+        or args.bundle_create is not None
+        or args.bundle_install
+        or args.profile_shell is not None
+        or args.shell_init
+        or args.restore is not None
+        or args.status
     ):
         parser.print_help()
         sys.exit(0)
 
-    collect_system_data()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.profile_shell is not None and args.profile_shell < 1:
+        parser.error("--profile-shell needs at least 1 run")
+
+    collect_system_data(refresh=args.refresh)
+    SETTINGS["backup_mode"] = args.backup_mode
+    SETTINGS["jobs"] = args.jobs
 
     if args.status:
         display_system_data()
 
     elif args.install or args.skipUser:
         display_system_data()
-        install(skipUser=args.skipUser)
+        install(skipUser=args.skipUser, dry_run=args.dry_run)
 
     elif args.backup:
-        backup_all()
+        sys.exit(0 if backup_all() else 1)
 
     elif args.backup_list:
         display_backups()
 
+    elif args.backup_diff:
+        display_backup_diff(*args.backup_diff)
+
+    elif args.backup_verify:
+        sys.exit(0 if verify_backups(args.backup_verify, deep=args.deep) else 1)
+
+    elif args.backup_prune:
+        prune_backups()
+
+    elif args.backup_reindex:
+        reindex_backups()
+
+    elif args.plugins_sync:
+        sys.exit(0 if sync_plugins_to_lock() else 1)
+
+    elif args.plugins_update:
+        sys.exit(0 if update_plugins() else 1)
+
+    elif args.plugins_mirror:
+        sys.exit(0 if refresh_mirrors() else 1)
+
+    elif args.bundle_create is not None:
+        sys.exit(0 if create_bundle(Path(args.bundle_create) if args.bundle_create else None) else 1)
+
+    elif args.bundle_install:
+        sys.exit(0 if install_bundle(Path(args.bundle_install), Path(args.bundle_dest)) else 1)
+
+    elif args.profile_shell is not None:
+        sys.exit(profile_shell(args.profile_shell))
+
+    elif args.shell_init:
+        print(f"Shell init snapshot written to {write_shell_init()}")
+
     elif args.restore is not None:
         # args.restore is 0 if --restore with no argument, or the number if provided
         restore(args.restore if args.restore > 0 else None)
@@ -31,11 +31,37 @@ RunCheck() {
 }
 # } ===
 
+# ============================================================================
+# Shell Init Snapshot {
+# ============================================================================
+# OS, brew prefix, git-prompt location and flutter completion only change with
+# the machine, `DotSetup.py --shell-init` resolves them into a snapshot.
+# A missing or stale snapshot is rebuilt in the background, this shell then
+# detects everything itself.
+ShellInit() {
+    DOTSETUP_INIT="${XDG_CACHE_HOME:-$HOME/.cache}/dotsetup/shell-init.sh"
+    DOTSETUP_INIT_LOADED=0
+    if [[ -f $DOTSETUP_INIT ]]; then
+        source "$DOTSETUP_INIT"
+    fi
+    if [[ $DOTSETUP_INIT_LOADED != 1 ]] && [[ -f $DOT_FILES/DotSetup.py ]] && command -v python3 &>/dev/null; then
+        (python3 "$DOT_FILES/DotSetup.py" --shell-init &>/dev/null &)
+    fi
+}
+# } ===
+
 # ============================================================================
 # Detect OS {
 # ============================================================================
 DetectOS() {
-    if [[ -f $DOT_FILES/scripts/detectOS.sh ]]; then
+    if [[ $DOTSETUP_INIT_LOADED == 1 ]]; then
+        export OS="$DOTSETUP_OS"
+        if [[ -n $DOTSETUP_OS_NAME ]]; then
+            echo "${RESET}OS Detect: $BOLD$GREEN$OS$RESET/$BOLD$GREEN$DOTSETUP_OS_NAME$RESET"
+        else
+            echo "$RESET == OS Detect:$BOLD$GREEN $OS$RESET == "
+        fi
+    elif [[ -f $DOT_FILES/scripts/detectOS.sh ]]; then
         source "$DOT_FILES/scripts/detectOS.sh"
     fi
 }
@@ -147,8 +173,14 @@ BashCompletion() {
 
     # OSX
     if [[ $OS == 'OSX' ]] && [[ $SHELL == */bash ]]; then
-        if command -v brew &>/dev/null && [[ -f "$(brew --prefix)/etc/bash_completion" ]]; then
-            source "$(brew --prefix)/etc/bash_completion"
+        local brew_prefix=""
+        if [[ $DOTSETUP_INIT_LOADED == 1 ]]; then
+            brew_prefix=$DOTSETUP_BREW_PREFIX
+        elif command -v brew &>/dev/null; then
+            brew_prefix=$(brew --prefix)
+        fi
+        if [[ -n $brew_prefix ]] && [[ -f "$brew_prefix/etc/bash_completion" ]]; then
+            source "$brew_prefix/etc/bash_completion"
             printf "${RESET}${GREEN}Bash Complete$RESET|"
         else
             printf "${RESET}${YELLOW}!! Bash Completion !!$RESET "
@@ -202,7 +234,9 @@ GitPrompt() {
     if [[ $SHELL == */bash || $SHELL == */zsh || $SHELL == */ash ]]; then
         # ash = https://en.wikipedia.org/wiki/Almquist_shell
 
-        if [[ -f /usr/lib/git-core/git-sh-prompt ]]; then
+        if [[ $DOTSETUP_INIT_LOADED == 1 ]] && [[ -f $DOTSETUP_GIT_PROMPT ]]; then
+            source "$DOTSETUP_GIT_PROMPT"
+        elif [[ -f /usr/lib/git-core/git-sh-prompt ]]; then
             source /usr/lib/git-core/git-sh-prompt
         elif [[ -f /usr/share/git-core/contrib/completion/git-prompt.sh ]]; then
             source /usr/share/git-core/contrib/completion/git-prompt.sh
@@ -236,7 +270,15 @@ GitPrompt() {
 # flutter completion {
 # ============================================================================
 FlutterBashCompletion() {
-    if command -v flutter &>/dev/null; then
+    if [[ $DOTSETUP_INIT_LOADED == 1 ]]; then
+        # Completion script cached by the snapshot, no flutter run
+        if [[ -f $DOTSETUP_FLUTTER_COMPLETION ]]; then
+            source "$DOTSETUP_FLUTTER_COMPLETION"
+            printf "${RESET}${GREEN}Flutter Completion$RESET|"
+        else
+            printf "${RESET}${YELLOW}!! Flutter Completion !!$RESET|"
+        fi
+    elif command -v flutter &>/dev/null; then
         source <(flutter bash-completion 2>/dev/null)
         printf "${RESET}${GREEN}Flutter Completion$RESET|"
     else
@@ -321,6 +363,7 @@ main() {
     fi
 
     Colors
+    ShellInit
     DetectOS
 
     HAS_RUN=$(RunCheck)